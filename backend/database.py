@@ -1,27 +1,113 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
 
+from backend.services.sqlprofile import instrument as instrument_profiling
+
 # -------------------------------------------------------------------
 # DATABASE URL
 # -------------------------------------------------------------------
 # Default: local SQLite file
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./database.db")
 
+# Async driver for the same database (async routes). Derived from
+# DATABASE_URL unless set: sqlite -> sqlite+aiosqlite, postgresql -> asyncpg
+_ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgres": "postgresql+asyncpg",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
+
+def to_async_url(url: str) -> str:
+    scheme, sep, rest = url.partition("://")
+    return _ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+
+# -------------------------------------------------------------------
+# Engine tuning (env)
+# -------------------------------------------------------------------
+# SQLite: WAL lets the API read while a Celery worker writes, and
+# busy_timeout makes a blocked writer wait instead of failing with
+# "database is locked".
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))  # negative = KiB (64 MiB)
+
+# Other backends (Postgres, ...): explicit connection pool sizing
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+
 # -------------------------------------------------------------------
 # SQLAlchemy Engine
 # -------------------------------------------------------------------
-# For SQLite, `check_same_thread=False` is required for async contexts.
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
-)
+def _apply_sqlite_pragmas(dbapi_conn, connection_record):
+    cur = dbapi_conn.cursor()
+    cur.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cur.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cur.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cur.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+    cur.close()
+
+def create_db_engine(url: str = DATABASE_URL, **kwargs):
+    """
+    The one place engines are built; the API and every Celery task share it.
+    SQLite gets WAL / synchronous / busy_timeout / mmap / cache pragmas on
+    each new connection; other backends get explicit pool settings.
+    With SQL_PROFILE=1 the engine also feeds services.sqlprofile.
+    """
+    if url.startswith("sqlite"):
+        # `check_same_thread=False` is required: sessions cross threads
+        # in FastAPI's threadpool and in the worker's background loop.
+        kwargs.setdefault("connect_args", {
+            "check_same_thread": False,
+            "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+        })
+        eng = create_engine(url, **kwargs)
+        event.listen(eng, "connect", _apply_sqlite_pragmas)
+        return instrument_profiling(eng)
+
+    kwargs.setdefault("pool_size", DB_POOL_SIZE)
+    kwargs.setdefault("max_overflow", DB_MAX_OVERFLOW)
+    kwargs.setdefault("pool_recycle", DB_POOL_RECYCLE)
+    kwargs.setdefault("pool_timeout", DB_POOL_TIMEOUT)
+    kwargs.setdefault("pool_pre_ping", True)
+    return instrument_profiling(create_engine(url, **kwargs))
+
+engine = create_db_engine()
+
+def create_async_db_engine(url: str = ASYNC_DATABASE_URL, **kwargs):
+    """Async counterpart of create_db_engine(), with the same pragmas / pool settings."""
+    if url.startswith("sqlite"):
+        kwargs.setdefault("connect_args", {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000})
+        eng = create_async_engine(url, **kwargs)
+        event.listen(eng.sync_engine, "connect", _apply_sqlite_pragmas)
+    else:
+        kwargs.setdefault("pool_size", DB_POOL_SIZE)
+        kwargs.setdefault("max_overflow", DB_MAX_OVERFLOW)
+        kwargs.setdefault("pool_recycle", DB_POOL_RECYCLE)
+        kwargs.setdefault("pool_timeout", DB_POOL_TIMEOUT)
+        kwargs.setdefault("pool_pre_ping", True)
+        eng = create_async_engine(url, **kwargs)
+    instrument_profiling(eng.sync_engine)
+    return eng
+
+async_engine = create_async_db_engine()
 
 # -------------------------------------------------------------------
 # Session Factory
 # -------------------------------------------------------------------
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False: attribute access after commit would need an await
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 # -------------------------------------------------------------------
 # Base Model Class
@@ -36,4 +122,12 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# -------------------------------------------------------------------
+# Async dependency - for `async def` routes, so DB calls never block
+# the event loop
+# -------------------------------------------------------------------
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,4 +1,9 @@
-from fastapi import FastAPI
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -6,11 +11,37 @@ from backend.routers.generate import router as generate_router
 from backend.routers.posts import router as posts_router
 from backend.routers.facebook import router as facebook_router
 from backend.routers.ai import router as ai_router
+from backend.routers.images import router as images_router
+from backend.services.llm import gateway
+from backend.services.graph import graph
+from backend.services import metrics, sqlprofile, images
+from backend.migrations import upgrade as upgrade_schema
+from backend.database import async_engine, AsyncSessionLocal
+from backend.services.hashtags import reload_forever as reload_hashtag_bank
+from backend.services.admission import Saturated
 
 
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # apply pending schema migrations (disable with AUTO_MIGRATE=0 and run
+    # `python -m backend.migrations` as a deploy step instead)
+    if os.getenv("AUTO_MIGRATE", "1") == "1":
+        upgrade_schema()
+    # one pooled Ollama / Graph client each for the whole process
+    await gateway.startup()
+    await graph.startup()
+    # hashtag bank lives in memory; re-read from the table in the background
+    bank_reloader = asyncio.create_task(reload_hashtag_bank(AsyncSessionLocal))
+    yield
+    bank_reloader.cancel()
+    await gateway.aclose()
+    await graph.aclose()
+    await async_engine.dispose()
+    images.shutdown_pool()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,4 +54,46 @@ app.add_middleware(
 app.include_router(generate_router)
 app.include_router(posts_router)
 app.include_router(facebook_router)
-app.include_router(ai_router)
\ No newline at end of file
+app.include_router(ai_router)
+app.include_router(images_router)
+
+
+# Ollama admission control: a full queue is a 429, not a minute-long wait
+@app.exception_handler(Saturated)
+async def llm_saturated(request: Request, exc: Saturated):
+    return JSONResponse(
+        {"error": "AI generation is busy, try again shortly", "retry_after": exc.retry_after},
+        status_code=429, headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+# ------------------------------
+# Metrics
+# ------------------------------
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # label by route template (/posts/{client_id}), not the raw path
+        route = request.scope.get("route")
+        metrics.observe_since(metrics.HTTP_LATENCY, started, method=request.method,
+                              route=getattr(route, "path", "unmatched"), status=str(status))
+
+if sqlprofile.SQL_PROFILE:
+    @app.middleware("http")
+    async def profile_sql(request: Request, call_next):
+        # statement count / DB time for this request, as headers and a log line
+        with sqlprofile.profile(f"{request.method} {request.url.path}") as prof:
+            response = await call_next(request)
+        response.headers.update(prof.headers())
+        return response
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
@@ -0,0 +1,206 @@
+"""
+Versioned schema migrations.
+
+Each migration is a function that takes a Connection (inside a transaction)
+and is applied once, in order; the highest applied version is kept in the
+`schema_version` table. Migrations must be idempotent (IF NOT EXISTS, column
+checks) because a database created by an older checkout may already have
+some of the objects.
+
+A brand-new database is created straight from the models and stamped with
+the latest version.
+
+    python -m backend.migrations            # upgrade ./database.db (or $DATABASE_URL)
+    python -m backend.migrations --status   # print current / latest version
+"""
+import sys
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from sqlalchemy import bindparam, inspect, text
+
+from backend.database import Base, engine
+import backend.models  # noqa: F401  (registers tables on Base.metadata)
+
+
+# ------------------------------
+# Helpers
+# ------------------------------
+def has_column(conn, table: str, column: str) -> bool:
+    return any(c["name"] == column for c in inspect(conn).get_columns(table))
+
+def add_column(conn, table: str, column: str, ddl: str):
+    if not has_column(conn, table, column):
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+# clients.posts_version is maintained by the database so every writer
+# (ORM, bulk Core statements in the workers, manual SQL) bumps it
+_POSTS_VERSION_TRIGGERS = {
+    "sqlite": [
+        """CREATE TRIGGER IF NOT EXISTS trg_posts_version_insert AFTER INSERT ON posts
+           BEGIN UPDATE clients SET posts_version = posts_version + 1 WHERE id = NEW.client_id; END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_posts_version_update AFTER UPDATE ON posts
+           BEGIN UPDATE clients SET posts_version = posts_version + 1
+                 WHERE id IN (OLD.client_id, NEW.client_id); END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_posts_version_delete AFTER DELETE ON posts
+           BEGIN UPDATE clients SET posts_version = posts_version + 1 WHERE id = OLD.client_id; END""",
+    ],
+    "postgresql": [
+        """CREATE OR REPLACE FUNCTION bump_posts_version() RETURNS trigger AS $$
+           BEGIN
+             IF TG_OP <> 'INSERT' THEN
+               UPDATE clients SET posts_version = posts_version + 1 WHERE id = OLD.client_id;
+             END IF;
+             IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.client_id IS DISTINCT FROM OLD.client_id) THEN
+               UPDATE clients SET posts_version = posts_version + 1 WHERE id = NEW.client_id;
+             END IF;
+             RETURN NULL;
+           END $$ LANGUAGE plpgsql""",
+        "DROP TRIGGER IF EXISTS trg_posts_version ON posts",
+        """CREATE TRIGGER trg_posts_version AFTER INSERT OR UPDATE OR DELETE ON posts
+           FOR EACH ROW EXECUTE FUNCTION bump_posts_version()""",
+    ],
+}
+
+def install_posts_version_triggers(conn):
+    for stmt in _POSTS_VERSION_TRIGGERS.get(conn.dialect.name, []):
+        conn.execute(text(stmt))
+
+
+# ------------------------------
+# Migrations
+# ------------------------------
+def m001_baseline(conn):
+    """Tables as they existed before versioning (created from the models)."""
+    Base.metadata.create_all(conn)
+
+def m002_hot_path_indexes(conn):
+    """Indexes for the scheduler / listing / publisher filters, unique weekly usage."""
+    # Collapse duplicate weekly_usage rows before the unique index goes on
+    conn.execute(text("""
+        UPDATE weekly_usage SET posts_made = (
+            SELECT MAX(w2.posts_made) FROM weekly_usage w2
+            WHERE w2.client_id = weekly_usage.client_id
+              AND w2.week_start = weekly_usage.week_start)
+    """))
+    conn.execute(text("""
+        DELETE FROM weekly_usage WHERE id NOT IN (
+            SELECT MIN(id) FROM weekly_usage GROUP BY client_id, week_start)
+    """))
+
+    for stmt in (
+        "CREATE INDEX IF NOT EXISTS ix_posts_client_status_created ON posts (client_id, status, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_posts_client_created ON posts (client_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_posts_client_scheduled ON posts (client_id, scheduled_at)",
+        "CREATE INDEX IF NOT EXISTS ix_posts_status_scheduled ON posts (status, scheduled_at)",
+        "CREATE INDEX IF NOT EXISTS ix_client_subscriptions_client_id ON client_subscriptions (client_id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_weekly_usage_client_week ON weekly_usage (client_id, week_start)",
+    ):
+        conn.execute(text(stmt))
+
+    # Rows written with the old func.now() default are stored as
+    # 'YYYY-MM-DD HH:MM:SS'; rewrite them in the format SQLAlchemy binds
+    # so range and keyset comparisons on created_at behave.
+    if conn.dialect.name == "sqlite":
+        conn.execute(text("""
+            UPDATE posts SET created_at = strftime('%Y-%m-%d %H:%M:%f000', created_at)
+            WHERE length(created_at) = 19
+        """))
+
+def m003_client_next_post_at(conn):
+    """Due-time index for the event-driven scheduler, backfilled from each client's prefs."""
+    from backend.models import Client
+    from backend.services.schedule import fire_time_today
+
+    add_column(conn, "clients", "next_post_at", "DATETIME")
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_clients_next_post_at ON clients (next_post_at)"))
+
+    rows = conn.execute(text(
+        "SELECT id, timezone, post_time_hour, post_time_minute FROM clients WHERE next_post_at IS NULL"
+    )).all()
+    if rows:
+        conn.execute(
+            Client.__table__.update()
+            .where(Client.__table__.c.id == bindparam("cid"))
+            .values(next_post_at=bindparam("next_post_at")),
+            [{"cid": r.id, "next_post_at": fire_time_today(r)} for r in rows],
+        )
+
+
+def m004_hashtag_bank(conn):
+    """Precomputed hashtag sets per (city, industry)."""
+    from backend.models import HashtagSet
+    HashtagSet.__table__.create(conn, checkfirst=True)
+
+
+def m005_client_scheduler_lease(conn):
+    """Lease columns so sharded scheduler runs never claim the same client."""
+    add_column(conn, "clients", "lease_owner", "VARCHAR")
+    add_column(conn, "clients", "lease_until", "DATETIME")
+
+
+def m006_client_posts_version(conn):
+    """Per-client posts version for conditional GET on the listing."""
+    add_column(conn, "clients", "posts_version", "INTEGER NOT NULL DEFAULT 0")
+    install_posts_version_triggers(conn)
+
+
+def m007_post_claimed_at(conn):
+    """Claim time, so posts stranded in "publishing" by a crashed run can be found."""
+    add_column(conn, "posts", "claimed_at", "DATETIME")
+
+
+MIGRATIONS = [
+    (1, m001_baseline),
+    (2, m002_hot_path_indexes),
+    (3, m003_client_next_post_at),
+    (4, m004_hashtag_bank),
+    (5, m005_client_scheduler_lease),
+    (6, m006_client_posts_version),
+    (7, m007_post_claimed_at),
+]
+LATEST = MIGRATIONS[-1][0]
+
+
+# ------------------------------
+# Runner
+# ------------------------------
+def current_version(conn) -> int:
+    if not inspect(conn).has_table("schema_version"):
+        return 0
+    return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+def _stamp(conn, version: int):
+    conn.execute(text("INSERT INTO schema_version (version) VALUES (:v)"), {"v": version})
+
+def upgrade(bind=None) -> int:
+    """Bring the database up to LATEST; returns the resulting version."""
+    bind = bind or engine
+    with bind.begin() as conn:
+        fresh = not inspect(conn).has_table("clients")
+        conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+        if fresh:
+            Base.metadata.create_all(conn)
+            install_posts_version_triggers(conn)
+            _stamp(conn, LATEST)
+            return LATEST
+        version = current_version(conn)
+
+    for number, migrate in MIGRATIONS:
+        if number <= version:
+            continue
+        with bind.begin() as conn:
+            migrate(conn)
+            _stamp(conn, number)
+        print(f"[migrations] applied {number:03d} {migrate.__name__}")
+        version = number
+    return version
+
+
+if __name__ == "__main__":
+    if "--status" in sys.argv:
+        with engine.connect() as conn:
+            print(f"current={current_version(conn)} latest={LATEST}")
+    else:
+        print(f"schema at version {upgrade()}")
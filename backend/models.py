@@ -1,7 +1,8 @@
 from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
-from sqlalchemy import Boolean, JSON, Date, func
-from sqlalchemy.orm import validates
+from sqlalchemy import JSON, Date, Index
+from sqlalchemy.orm import validates, deferred
 from sqlalchemy.orm import relationship
+from sqlalchemy import event
 from datetime import datetime
 from sqlalchemy import JSON
 from backend.database import Base  # ✅ Base comes from database.py
@@ -20,12 +21,14 @@ class Client(Base):
     city = Column(String, nullable=True)
     industry = Column(String, nullable=True)
 
-    # Facebook integration
+    # Facebook integration. The token and the page list (the full Graph
+    # /me/accounts payload) are only loaded on access, or with
+    # undefer_group("facebook"); async sessions must undefer them.
     facebook_page_id = Column(String, nullable=True)
-    facebook_page_token = Column(Text, nullable=True)
+    facebook_page_token = deferred(Column(Text, nullable=True), group="facebook")
 
     # Temporary page list (for post-login display)
-    temp_facebook_pages = Column(JSON, nullable=True)
+    temp_facebook_pages = deferred(Column(JSON, nullable=True), group="facebook")
 
     # AI preferences
     preferences_json = Column(JSON, nullable=True)  # {"categories": [...], "ai_auto": true}
@@ -34,6 +37,17 @@ class Client(Base):
     post_time_hour = Column(Integer, default=17)
     post_time_minute = Column(Integer, default=0)
 
+    # Due-time index: next UTC time the AI scheduler should look at this
+    # client (see backend/services/schedule.py)
+    next_post_at = Column(DateTime, nullable=True, index=True)
+    # Scheduler lease: the shard run holding this client, and until when
+    lease_owner = Column(String, nullable=True)
+    lease_until = Column(DateTime, nullable=True)
+    # Bumped by a database trigger on every insert / update / delete of this
+    # client's posts (see migrations.install_posts_version_triggers); the
+    # GET /posts ETag
+    posts_version = Column(Integer, nullable=False, default=0, server_default="0")
+
     # Relationships
     posts = relationship("Post", back_populates="client")
 
@@ -41,6 +55,21 @@ class Client(Base):
         return f"<Client id={self.id} name={self.name}>"
 
 
+# Lightweight projection for the worker paths: plain rows (no identity map,
+# no blobs) with everything schedule.py and the scheduler read from a client
+CLIENT_SCHEDULE_COLUMNS = (
+    Client.id, Client.city, Client.industry, Client.model_name, Client.preferences_json,
+    Client.timezone, Client.post_time_hour, Client.post_time_minute,
+)
+
+
+@event.listens_for(Client, "before_insert")
+def _client_next_post_at(mapper, connection, target):
+    if target.next_post_at is None:
+        from backend.services.schedule import fire_time_today
+        target.next_post_at = fire_time_today(target)
+
+
 class Post(Base):
     __tablename__ = "posts"
 
@@ -51,13 +80,27 @@ class Post(Base):
     hashtags = Column(Text, nullable=True)
     image_url = Column(String, nullable=True)
 
-    status = Column(String, default="draft")  # draft, scheduled, posted, failed
-    created_at = Column(DateTime, default=func.now())
+    status = Column(String, default="draft")  # draft, scheduled, publishing, posted, failed
+    # Python-side default so SQLite stores one text format (keyset paging compares it)
+    created_at = Column(DateTime, default=datetime.utcnow)
     scheduled_at = Column(DateTime, nullable=True)
     posted_at = Column(DateTime, nullable=True)
+    # when the publisher moved it to "publishing"; stale claims are marked failed
+    claimed_at = Column(DateTime, nullable=True)
 
     client = relationship("Client", back_populates="posts")
 
+    __table_args__ = (
+        # scheduler draft lookup / status-filtered listings
+        Index("ix_posts_client_status_created", "client_id", "status", "created_at"),
+        # keyset listing: WHERE client_id = ? ORDER BY created_at, id
+        Index("ix_posts_client_created", "client_id", "created_at"),
+        # "already has a post today": client + scheduled_at range
+        Index("ix_posts_client_scheduled", "client_id", "scheduled_at"),
+        # publisher: status = 'scheduled' AND scheduled_at <= now
+        Index("ix_posts_status_scheduled", "status", "scheduled_at"),
+    )
+
     def __repr__(self):
         return f"<Post id={self.id} status={self.status}>"
 
@@ -81,7 +124,7 @@ class ClientSubscription(Base):
     __tablename__ = "client_subscriptions"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
+    client_id = Column(Integer, ForeignKey("clients.id"), nullable=False, index=True)
     plan_id = Column(Integer, ForeignKey("subscription_plans.id"), nullable=False)
 
     def __repr__(self):
@@ -96,9 +139,38 @@ class WeeklyUsage(Base):
     week_start = Column(Date, nullable=False)
     posts_made = Column(Integer, default=0)
 
+    __table_args__ = (
+        # one row per client per week; also the target of quota upserts
+        Index("uq_weekly_usage_client_week", "client_id", "week_start", unique=True),
+    )
+
     @validates("posts_made")
     def validate_posts(self, key, value):
         return max(0, value)
 
     def __repr__(self):
-        return f"<WeeklyUsage client={self.client_id} week={self.week_start} posts={self.posts_made}>"
\ No newline at end of file
+        return f"<WeeklyUsage client={self.client_id} week={self.week_start} posts={self.posts_made}>"
+
+
+# -----------------------------
+# Hashtag Bank
+# -----------------------------
+
+class HashtagSet(Base):
+    """Ranked hashtags for one (city, industry) pair, refreshed by a background job."""
+    __tablename__ = "hashtag_bank"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    city = Column(String, nullable=False)        # normalized: lower-case, single spaces
+    industry = Column(String, nullable=False)
+    hashtags = Column(JSON, nullable=False)      # ["#AzusaNails", ...], most relevant first
+    model = Column(String, nullable=True)
+    refreshed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        Index("uq_hashtag_bank_city_industry", "city", "industry", unique=True),
+    )
+
+    def __repr__(self):
+        return f"<HashtagSet {self.city}/{self.industry} tags={len(self.hashtags or [])}>"
+
@@ -1,9 +1,14 @@
 from fastapi import APIRouter, Depends
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from backend.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.database import get_db, get_async_db
 from backend.models import Client
-from backend.services.ai import generate_caption_async
+from backend.services.ai import generate_caption_async, stream_caption, parse_caption
+from backend.services.sse import sse_response
+from backend.services.admission import admission
+from backend.services.cache import hash_text, caption_index
+from backend.services.schedule import fire_time_today, dispatch_at
 
 router = APIRouter(prefix="/ai", tags=["ai"])
 
@@ -25,17 +30,48 @@ def set_prefs(body: PrefsIn, db: Session = Depends(get_db)):
     if body.timezone: c.timezone = body.timezone
     if body.post_time_hour is not None: c.post_time_hour = body.post_time_hour
     if body.post_time_minute is not None: c.post_time_minute = body.post_time_minute
+    # recompute the due-time index and arm an exact run for it
+    c.next_post_at = fire_time_today(c)
     db.add(c); db.commit()
-    return {"ok": True}
+    dispatch_at([c.id], c.next_post_at)
+    return {"ok": True, "next_post_at": c.next_post_at.isoformat()}
 
 class GenerateIn(BaseModel):
     client_id: int
     brief: str | None = None  # if None and ai_auto=True, we still generate
 
 @router.post("/generate-once")
-async def generate_once(body: GenerateIn, db: Session = Depends(get_db)):
-    c = db.query(Client).filter(Client.id==body.client_id).first()
+async def generate_once(body: GenerateIn, db: AsyncSession = Depends(get_async_db)):
+    c = await db.get(Client, body.client_id)
+    if not c: return {"error":"client not found"}
+    cats = (c.preferences_json or {}).get("categories", [])
+    # hand the connection back to the pool while the model runs
+    await db.commit()
+    result = await generate_caption_async(body.brief or "", cats, c.city, c.model_name, industry=c.industry)
+    if not isinstance(result, dict):
+        return {"ok": True, "result": result, "duplicate": False}
+
+    # reject a caption identical to one of this client's recent posts
+    await caption_index.warm_async(db, [c.id])
+    duplicate = caption_index.is_duplicate(c.id, result.get("caption"))
+    if duplicate:
+        retry = await generate_caption_async(body.brief or "", cats, c.city, c.model_name,
+                                             use_cache=False, industry=c.industry)
+        if isinstance(retry, dict):
+            result = retry
+            duplicate = caption_index.is_duplicate(c.id, result.get("caption"))
+    return {"ok": True, "result": result, "duplicate": duplicate}
+
+@router.post("/generate-once/stream")
+async def generate_once_stream(body: GenerateIn, db: AsyncSession = Depends(get_async_db)):
+    """Streams the raw model output as SSE, then the parsed result in `done`."""
+    c = await db.get(Client, body.client_id)
     if not c: return {"error":"client not found"}
     cats = (c.preferences_json or {}).get("categories", [])
-    result = await generate_caption_async(body.brief or "", cats, c.city, c.model_name)
-    return {"ok": True, "result": result}
\ No newline at end of file
+    await db.commit()
+
+    def finalize(text):
+        result = parse_caption(text)
+        return {"ok": True, "result": result, "hash": hash_text(str(result.get("caption", "")))}
+    admission.check()
+    return sse_response(stream_caption(body.brief or "", cats, c.city, c.model_name), finalize)
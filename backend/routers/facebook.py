@@ -1,9 +1,11 @@
 import os
-import requests
+import httpx
 from fastapi import APIRouter, Depends, Request
-from sqlalchemy.orm import Session
-from backend.database import get_db
+from sqlalchemy.orm import Session, undefer_group
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.database import get_db, get_async_db
 from backend.models import Client
+from backend.services.graph import graph, GraphError, GRAPH_INTERACTIVE_TIMEOUT
 
 FB_APP_ID = os.getenv("FB_APP_ID")
 FB_APP_SECRET = os.getenv("FB_APP_SECRET")
@@ -35,6 +37,23 @@ def get_or_create_client(db: Session, client_id: int = None):
     db.refresh(client)
     print(f"🆕 Created new client with ID {client.id}")
     return client
+
+async def get_or_create_client_async(db: AsyncSession, client_id: int = None):
+    """get_or_create_client() for async routes."""
+    if client_id:
+        client = await db.get(Client, client_id)
+        if client:
+            return client
+
+    client = Client(
+        name=f"Client_{client_id or 'auto'}",
+        city="Unknown",
+        industry="General"
+    )
+    db.add(client)
+    await db.commit()
+    print(f"🆕 Created new client with ID {client.id}")
+    return client
 @router.get("/facebook/login-url")
 def facebook_login_url(client_id: int = None, db: Session = Depends(get_db)):
     FB_APP_ID = os.getenv("FB_APP_ID")
@@ -54,7 +73,7 @@ def facebook_login_url(client_id: int = None, db: Session = Depends(get_db)):
     return {"url": login_url, "client_id": client.id}
 
 @router.get("/facebook/callback")
-def facebook_callback(request: Request, db: Session = Depends(get_db)):
+async def facebook_callback(request: Request, db: AsyncSession = Depends(get_async_db)):
     """
     Handles Facebook redirect after login.
     Extracts both ?code=... and ?state=client_id.
@@ -71,25 +90,24 @@ def facebook_callback(request: Request, db: Session = Depends(get_db)):
     client_id = int(state) if state and state.isdigit() else None
 
     # ✅ Ensure the client exists or create a new one
-    client = get_or_create_client(db, client_id)
+    client = await get_or_create_client_async(db, client_id)
 
     # Then continue with the same logic below
     FB_APP_ID = os.getenv("FB_APP_ID")
     FB_APP_SECRET = os.getenv("FB_APP_SECRET")
     FB_REDIRECT_URI = os.getenv("FB_REDIRECT_URI")
-    FB_API_URL = os.getenv("FB_API_URL", "https://graph.facebook.com/v24.0")
 
     # Exchange Facebook code for access token
-    token_url = (
-        f"{FB_API_URL}/oauth/access_token"
-        f"?client_id={FB_APP_ID}"
-        f"&redirect_uri={FB_REDIRECT_URI}"
-        f"&client_secret={FB_APP_SECRET}"
-        f"&code={code}"
-    )
-
-    r = requests.get(token_url)
-    token_data = r.json()
+    try:
+        token_data = await graph.get("/oauth/access_token", {
+            "client_id": FB_APP_ID,
+            "redirect_uri": FB_REDIRECT_URI,
+            "client_secret": FB_APP_SECRET,
+            "code": code,
+        }, timeout=GRAPH_INTERACTIVE_TIMEOUT)
+    except (httpx.HTTPError, ValueError) as e:
+        print(f"❌ Token exchange request failed: {e!r}")
+        return {"error": "Token exchange failed", "details": str(e), "client_id": client.id}
     access_token = token_data.get("access_token")
 
     if not access_token:
@@ -97,15 +115,19 @@ def facebook_callback(request: Request, db: Session = Depends(get_db)):
         return {"error": "Token exchange failed", "details": token_data, "client_id": client.id}
 
     # Get managed Facebook pages
-    pages_url = f"{FB_API_URL}/me/accounts?access_token={access_token}"
-    pages_res = requests.get(pages_url).json()
-    pages = pages_res.get("data", [])
+    try:
+        pages = await graph.me_accounts(access_token)
+    except GraphError as e:
+        print(f"❌ Error fetching pages: {e}")
+        pages = []
+    except (httpx.HTTPError, ValueError) as e:
+        print(f"❌ Error fetching pages: {e!r}")
+        pages = []
 
     # Save pages to DB
     client.temp_facebook_pages = pages
     db.add(client)
-    db.commit()
-    db.refresh(client)
+    await db.commit()
 
     print(f"✅ Saved {len(pages)} pages for client {client.id}")
 
@@ -124,13 +146,8 @@ def select_page(data: dict, db: Session = Depends(get_db)):
     return {"status": "saved"}
 
 @router.get("/facebook/pages")
-def get_temp_pages(client_id: int, db: Session = Depends(get_db)):
-    from backend.models import Client
-    import requests, os, json
-
-    FB_API_URL = os.getenv("FB_API_URL", "https://graph.facebook.com/v24.0")
-
-    client = db.query(Client).filter(Client.id == client_id).first()
+async def get_temp_pages(client_id: int, db: AsyncSession = Depends(get_async_db)):
+    client = await db.get(Client, client_id, options=[undefer_group("facebook")])
     if not client:
         return {"error": f"Client with ID {client_id} not found"}
 
@@ -144,19 +161,14 @@ def get_temp_pages(client_id: int, db: Session = Depends(get_db)):
         return {"client_id": client.id, "pages": []}
 
     try:
-        print(f"🔄 Fetching live pages from Facebook for client {client.id}")
-        res = requests.get(
-            f"{FB_API_URL}/me/accounts?access_token={client.facebook_page_token}"
-        )
-        pages_json = res.json()
-
-        print("📘 Live pages response:", json.dumps(pages_json, indent=2))
-
-        pages = pages_json.get("data", [])
-        client.temp_facebook_pages = pages
-        db.add(client)
-        db.commit()
-        db.refresh(client)
+        # served from the per-token TTL cache while UI polling repeats
+        pages = await graph.me_accounts(client.facebook_page_token)
+
+        # only write the row when the page list actually changed
+        if pages and pages != client.temp_facebook_pages:
+            client.temp_facebook_pages = pages
+            db.add(client)
+            await db.commit()
 
         return {"client_id": client.id, "pages": pages}
 
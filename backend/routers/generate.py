@@ -1,46 +1,46 @@
-from fastapi import APIRouter
-import httpx
-import hashlib
-import os
+from fastapi import APIRouter, Depends
+import json
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.database import get_async_db
+from backend.models import Client
+from backend.services.llm import gateway
+from backend.services.cache import hash_text, generation_cache, generation_key
+from backend.services.sse import sse_response
+from backend.services.hashtags import sample_or_none
+from backend.services.admission import admission
 
 # ------------------------------
 # Router & Config
 # ------------------------------
 router = APIRouter(prefix="/generate", tags=["generate"])
 
-OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
-OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3")
-
-def hash_text(s: str) -> str:
-    return hashlib.sha256(s.strip().lower().encode()).hexdigest()
-
 # ------------------------------
 # Core Ollama Chat Function
 # ------------------------------
-async def ollama_chat(messages):
+async def ollama_chat(messages, use_cache: bool = True):
     """
-    Uses Ollama's /api/chat format (correct for your version).
+    Uses Ollama's /api/chat format (correct for your version),
+    through the shared, pooled gateway. Identical prompts are served
+    from generation_cache.
     """
-    async with httpx.AsyncClient(timeout=60) as client:
-        r = await client.post(
-            f"{OLLAMA_URL}/api/chat",
-            json={
-                "model": OLLAMA_MODEL,
-                "messages": messages,
-                "temperature": 0.6,
-                "stream": False
-            }
-        )
-        r.raise_for_status()
-        data = r.json()
-        # Response structure: { "message": { "content": "..." } }
-        return data["message"]["content"].strip()
+    key = generation_key(gateway.model, json.dumps(messages, sort_keys=True))
+    if use_cache:
+        cached = generation_cache.get(key)
+        if cached is not None:
+            return cached
+
+    content = await gateway.chat(messages, temperature=0.6)
+    if content:
+        generation_cache.set(key, content)
+    return content
 
 # ------------------------------
-# Caption Generator Endpoint
+# Prompts (shared by the blocking and streaming endpoints)
 # ------------------------------
-@router.post("/caption")
-async def gen_caption(payload: dict):
+def caption_messages(payload: dict) -> list[dict]:
     business = payload.get("businessName", "")
     city = payload.get("city", "")
     vibe = payload.get("vibe", "")
@@ -61,27 +61,98 @@ async def gen_caption(payload: dict):
         f"Write one caption."
     )
 
-    caption = await ollama_chat([
+    return [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": user_prompt},
-    ])
-
-    return {"caption": caption, "hash": hash_text(caption)}
+    ]
 
-# ------------------------------
-# Hashtag Generator Endpoint
-# ------------------------------
-@router.post("/hashtags")
-async def gen_hashtags(payload: dict):
+def hashtag_messages(payload: dict) -> list[dict]:
     city = payload.get("city", "")
     services = payload.get("services", "")
 
     system_prompt = "You generate clean, relevant, local discovery hashtags. No filler."
     user_prompt = f"Generate 6-10 hashtags for a {services} business in {city}. One line only."
 
-    hashtags = await ollama_chat([
+    return [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": user_prompt},
-    ])
+    ]
+
+# ------------------------------
+# Caption Generator Endpoint
+# ------------------------------
+@router.post("/caption")
+async def gen_caption(payload: dict):
+    caption = await ollama_chat(caption_messages(payload))
+    return {"caption": caption, "hash": hash_text(caption)}
+
+@router.post("/caption/stream")
+async def gen_caption_stream(payload: dict):
+    """Same as /caption, streamed as SSE `token` events then a final `done`."""
+    def finalize(text):
+        caption = text.strip()
+        return {"caption": caption, "hash": hash_text(caption)}
+    # reject with 429 up front; once the stream has started it is too late
+    admission.check()
+    return sse_response(gateway.stream_chat(caption_messages(payload), temperature=0.6), finalize)
+
+# ------------------------------
+# Hashtag Generator Endpoint
+# ------------------------------
+async def banked_hashtags(payload: dict, db: AsyncSession) -> str | None:
+    """
+    Bank sample for the request, or None. The bank is keyed by the
+    clients' (city, industry), so it is only consulted when the request
+    names a `client_id` or an `industry`; free-text `services` never
+    matches a bank key.
+    """
+    city, industry = payload.get("city"), payload.get("industry")
+    client_id = payload.get("client_id")
+    if client_id is not None:
+        try:
+            row = (await db.execute(
+                select(Client.city, Client.industry).where(Client.id == int(client_id))
+            )).first()
+        except (TypeError, ValueError):
+            row = None
+        if row:
+            city, industry = row.city or city, row.industry or industry
+    elif industry is None:
+        return None
+    return sample_or_none(city, industry)
+
+@router.post("/hashtags")
+async def gen_hashtags(payload: dict, db: AsyncSession = Depends(get_async_db)):
+    # banked (city, industry) pairs never reach the model
+    hashtags = await banked_hashtags(payload, db)
+    if hashtags:
+        return {"hashtags": hashtags, "source": "bank"}
+    hashtags = await ollama_chat(hashtag_messages(payload))
+    return {"hashtags": hashtags, "source": "live"}
+
+async def _once(text: str):
+    yield text
+
+@router.post("/hashtags/stream")
+async def gen_hashtags_stream(payload: dict, db: AsyncSession = Depends(get_async_db)):
+    """Same as /hashtags, streamed as SSE `token` events then a final `done`."""
+    def finalize(text):
+        hashtags = text.strip()
+        return {"hashtags": hashtags, "hash": hash_text(hashtags)}
+    banked = await banked_hashtags(payload, db)
+    if banked:
+        return sse_response(_once(banked), finalize)
+    admission.check()
+    return sse_response(gateway.stream_chat(hashtag_messages(payload), temperature=0.6), finalize)
+
+# ------------------------------
+# Cache Stats
+# ------------------------------
+@router.get("/cache-stats")
+def cache_stats():
+    return generation_cache.stats()
 
-    return {"hashtags": hashtags}
\ No newline at end of file
+@router.get("/queue-stats")
+async def queue_stats():
+    """Ollama slots in use / queued per lane in this API process."""
+    return admission.stats()
@@ -0,0 +1,94 @@
+import os
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import FileResponse, JSONResponse, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.database import get_async_db
+from backend.models import Post
+from backend.services.images import (
+    DERIVATIVES, DIGEST_RE, ImageError, derivative_path, ensure_derivatives, image_url,
+    ingest_stream, original_path, sniff_type,
+)
+
+router = APIRouter(prefix="/images", tags=["images"])
+
+# Content-addressed: the bytes behind a URL never change
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+@router.post("")
+async def upload_image(request: Request, post_id: int | None = None,
+                       db: AsyncSession = Depends(get_async_db)):
+    """
+    Upload an image as the raw request body (Content-Type: image/*).
+    Identical bytes are stored once. Derivatives are built before returning.
+    With `post_id`, the post's image_url is set to the stored image.
+    """
+    try:
+        digest, size, created = await ingest_stream(request.stream())
+    except ImageError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    try:
+        await ensure_derivatives(digest)
+    except Exception as e:
+        # the original is stored; derivatives are retried on first read
+        print(f"⚠️ Derivatives failed for image {digest}: {e!r}")
+
+    if post_id is not None:
+        post = await db.get(Post, post_id)
+        if not post:
+            return JSONResponse({"error": "post not found"}, status_code=404)
+        post.image_url = image_url(digest)
+        await db.commit()
+
+    return {
+        "sha256": digest,
+        "size": size,
+        "deduplicated": not created,
+        "url": image_url(digest),
+        "thumb_url": f"{image_url(digest)}/thumb",
+    }
+
+
+@router.get("/{digest}")
+async def get_original(digest: str, request: Request):
+    return await _serve(digest, "original", request)
+
+
+@router.get("/{digest}/{kind}")
+async def get_derivative(digest: str, kind: str, request: Request):
+    """`kind` is "thumb" or "fb"."""
+    return await _serve(digest, kind, request)
+
+
+async def _serve(digest: str, kind: str, request: Request):
+    if not DIGEST_RE.match(digest) or (kind != "original" and kind not in DERIVATIVES):
+        return JSONResponse({"error": "not found"}, status_code=404)
+    if not os.path.exists(original_path(digest)):
+        return JSONResponse({"error": "not found"}, status_code=404)
+
+    etag = f'"{digest}-{kind}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": IMMUTABLE})
+
+    if kind != "original":
+        path = derivative_path(digest, kind)
+        if not os.path.exists(path):
+            try:
+                await ensure_derivatives(digest)
+            except Exception as e:
+                print(f"⚠️ Derivative {kind} failed for image {digest}: {e!r}")
+        if os.path.exists(path):
+            return FileResponse(path, media_type="image/jpeg",
+                                headers={"ETag": etag, "Cache-Control": IMMUTABLE})
+        # serve the original meanwhile; not cacheable, the derivative is retried next time
+        return _original(digest, {"Cache-Control": "no-cache"})
+
+    return _original(digest, {"ETag": etag, "Cache-Control": IMMUTABLE})
+
+
+def _original(digest: str, headers: dict) -> FileResponse:
+    path = original_path(digest)
+    with open(path, "rb") as f:
+        media_type = sniff_type(f.read(16)) or "application/octet-stream"
+    return FileResponse(path, media_type=media_type, headers=headers)
@@ -1,26 +1,152 @@
-from fastapi import APIRouter, Depends
+import base64
+import json
+import os
+from datetime import datetime, timezone
+
+import orjson
+from fastapi import APIRouter, Depends, Query, Request, Response
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import Session
 
-from backend.models import Post        # ✅ CORRECT IMPORT
+from backend.models import Client, Post        # ✅ CORRECT IMPORT
 from backend.database import get_db    # ✅ CORRECT IMPORT
+from backend.services import archive
+from backend.services.cache import TTLCache
 
 router = APIRouter(prefix="/posts", tags=["posts"])
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Serialized listing pages, keyed by (client, posts_version, query); a
+# version bump makes old entries unreachable and they age out
+LISTING_CACHE_SIZE = int(os.getenv("POSTS_LISTING_CACHE_SIZE", "2048"))
+LISTING_CACHE_TTL = float(os.getenv("POSTS_LISTING_CACHE_TTL", "600"))
+listing_cache = TTLCache(maxsize=LISTING_CACHE_SIZE, ttl=LISTING_CACHE_TTL)
+
+# ------------------------------
+# Cursor helpers
+# ------------------------------
+# A cursor is the (created_at, id) of the last row on the previous page,
+# packed as url-safe base64 JSON. Pages are ordered newest first.
+def encode_cursor(created_at: datetime, post_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), post_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(token: str) -> tuple[datetime, int]:
+    raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    created_at, post_id = json.loads(raw)
+    return datetime.fromisoformat(created_at), int(post_id)
+
+def naive_utc(at: datetime | None) -> datetime | None:
+    """Stored datetimes are naive UTC (both in the posts table and the archive)."""
+    if at is not None and at.tzinfo is not None:
+        at = at.astimezone(timezone.utc).replace(tzinfo=None)
+    return at
+
+# ------------------------------
+# Listing
+# ------------------------------
 @router.get("/{client_id}")
-def get_posts(client_id: int, db: Session = Depends(get_db)):
-    posts = (
-        db.query(Post)
+def get_posts(
+    request: Request,
+    client_id: int,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    status: str | None = None,
+    scheduled_from: datetime | None = None,
+    scheduled_to: datetime | None = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Keyset-paginated posts for a client, newest first.
+    Pass the returned `next_cursor` back as `cursor` to get the next page;
+    it is null on the last page. Pages that reach past the posts table
+    continue into the archived partitions (see services/archive.py).
+
+    The ETag is the client's posts_version, so a poll with a matching
+    If-None-Match gets a 304 after one primary-key read of `clients`;
+    unchanged pages are served from listing_cache.
+    """
+    version = db.query(Client.posts_version).filter(Client.id == client_id).scalar() or 0
+    etag = f'"{client_id}-{version}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    key = (client_id, version, limit, cursor, status, scheduled_from, scheduled_to)
+    body = listing_cache.get(key)
+    if body is None:
+        payload = list_posts(db, client_id, limit, cursor, status, scheduled_from, scheduled_to)
+        if "error" in payload:
+            return payload
+        body = orjson.dumps(payload)
+        listing_cache.set(key, body)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def list_posts(db, client_id: int, limit: int, cursor: str | None, status: str | None,
+               scheduled_from: datetime | None, scheduled_to: datetime | None) -> dict:
+    # one meaning for both tiers: an offset-aware bound is converted, not dropped
+    scheduled_from, scheduled_to = naive_utc(scheduled_from), naive_utc(scheduled_to)
+    q = (
+        db.query(Post.id, Post.caption, Post.hashtags, Post.status,
+                 Post.created_at, Post.scheduled_at)
         .filter(Post.client_id == client_id)
-        .order_by(Post.created_at.desc())
+    )
+    if status:
+        q = q.filter(Post.status == status)
+    if scheduled_from:
+        q = q.filter(Post.scheduled_at >= scheduled_from)
+    if scheduled_to:
+        q = q.filter(Post.scheduled_at < scheduled_to)
+    before = None
+    if cursor:
+        try:
+            after_created, after_id = decode_cursor(cursor)
+        except (ValueError, TypeError):
+            return {"error": "invalid cursor"}
+        before = (after_created, after_id)
+        q = q.filter(or_(
+            Post.created_at < after_created,
+            and_(Post.created_at == after_created, Post.id < after_id),
+        ))
+
+    rows = [
+        r._asdict() for r in
+        q.order_by(Post.created_at.desc(), Post.id.desc())
+        .limit(limit + 1)
         .all()
+    ]
+
+    # archived rows are all older than `horizon`; only read them when the
+    # page could reach that far
+    horizon = archive.newest_archived(client_id)
+    if horizon and (len(rows) <= limit or rows[-1]["created_at"] < horizon):
+        def match(r):
+            return ((not status or r["status"] == status)
+                    and (not scheduled_from or (r["scheduled_at"] and r["scheduled_at"] >= scheduled_from))
+                    and (not scheduled_to or (r["scheduled_at"] and r["scheduled_at"] < scheduled_to)))
+        hot_ids = {r["id"] for r in rows}
+        cold = [r for r in archive.archived_page(client_id, limit + 1, before, match) if r["id"] not in hot_ids]
+        rows = sorted(rows + cold, key=lambda r: (r["created_at"], r["id"]), reverse=True)[:limit + 1]
+
+    page = rows[:limit]
+    next_cursor = (
+        encode_cursor(page[-1]["created_at"], page[-1]["id"])
+        if len(rows) > limit else None
     )
 
-    return [
-        {
-            "id": p.id,
-            "caption": p.caption,
-            "hashtags": p.hashtags,
-            "created_at": p.created_at.isoformat(),
-        }
-        for p in posts
-    ]
\ No newline at end of file
+    return {
+        "items": [
+            {
+                "id": p["id"],
+                "caption": p["caption"],
+                "hashtags": p["hashtags"],
+                "status": p["status"],
+                "created_at": p["created_at"].isoformat(),
+                "scheduled_at": p["scheduled_at"].isoformat() if p["scheduled_at"] else None,
+            }
+            for p in page
+        ],
+        "next_cursor": next_cursor,
+    }
@@ -0,0 +1,322 @@
+import asyncio
+import math
+import os
+import time
+import uuid
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+from backend.services.metrics import (
+    LLM_QUEUE_DEPTH, LLM_QUEUE_WAIT, LLM_REJECTED, LLM_SLOTS_IN_USE,
+)
+
+# ------------------------------
+# Config
+# ------------------------------
+# Lanes in priority order: a free slot always goes to the oldest
+# interactive waiter before any batch waiter.
+LANES = ("interactive", "batch")
+
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "4"))
+# Batch work may hold at most this many slots, so a scheduler burst always
+# leaves room for the UI
+OLLAMA_BATCH_MAX = int(os.getenv("OLLAMA_BATCH_MAX", str(max(1, OLLAMA_MAX_CONCURRENCY - 1))))
+OLLAMA_QUEUE_LIMITS = {
+    "interactive": int(os.getenv("OLLAMA_INTERACTIVE_QUEUE", "32")),
+    "batch": int(os.getenv("OLLAMA_BATCH_QUEUE", "1000")),
+}
+# Longest an interactive request waits for a slot before getting a 429;
+# batch work waits as long as it takes (its callers have their own deadlines)
+OLLAMA_QUEUE_WAIT = {
+    "interactive": float(os.getenv("OLLAMA_INTERACTIVE_WAIT", "30")),
+    "batch": None,
+}
+
+# Shared slots: with a Redis URL, every API and worker process draws from
+# one OLLAMA_MAX_CONCURRENCY budget (batch capped at OLLAMA_BATCH_MAX), so
+# the UI's interactive lane and the Celery batch lane really compete for the
+# same Ollama. Without one, the caps hold per process (per event loop).
+OLLAMA_ADMISSION_URL = os.getenv("OLLAMA_ADMISSION_URL", os.getenv("REDIS_URL", ""))
+OLLAMA_ADMISSION_KEY = os.getenv("OLLAMA_ADMISSION_KEY", "ollama:slots")
+# A slot not released within this long (crashed process) is reclaimed
+OLLAMA_SLOT_TTL = int(os.getenv("OLLAMA_SLOT_TTL", "600"))
+OLLAMA_SLOT_POLL = float(os.getenv("OLLAMA_SLOT_POLL", "0.05"))
+
+_default_lane = "interactive"
+_lane: ContextVar[str | None] = ContextVar("llm_lane", default=None)
+
+
+def set_default_lane(lane: str):
+    """Process-wide lane (Celery workers run as "batch")."""
+    global _default_lane
+    _default_lane = lane
+
+
+def current_lane() -> str:
+    return _lane.get() or _default_lane
+
+
+@contextmanager
+def lane(name: str):
+    token = _lane.set(name)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+class Saturated(Exception):
+    """The lane's queue is full (or the wait ran out); retry after `retry_after` seconds."""
+
+    def __init__(self, lane: str, retry_after: int):
+        self.lane = lane
+        self.retry_after = retry_after
+        super().__init__(f"LLM {lane} queue is saturated, retry after {retry_after}s")
+
+
+class SharedSlots:
+    """
+    Counting semaphore in Redis shared by every process. Holders are kept
+    in sorted sets ("<key>:all", "<key>:batch") scored by acquire time, and
+    one Lua script checks both caps and takes the slot atomically. Holders
+    older than OLLAMA_SLOT_TTL are dropped on the next acquire, so a
+    crashed process can't leak slots for good.
+    """
+
+    _ACQUIRE = """
+    local now = tonumber(redis.call('TIME')[1])
+    local stale = now - tonumber(ARGV[1])
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', stale)
+    redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', stale)
+    if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[2]) then return 0 end
+    if ARGV[4] == 'batch' then
+        if redis.call('ZCARD', KEYS[2]) >= tonumber(ARGV[3]) then return 0 end
+        redis.call('ZADD', KEYS[2], now, ARGV[5])
+    end
+    redis.call('ZADD', KEYS[1], now, ARGV[5])
+    return 1
+    """
+
+    def __init__(self, url: str, capacity: int, batch_max: int,
+                 key: str = OLLAMA_ADMISSION_KEY, ttl: int = OLLAMA_SLOT_TTL):
+        import redis.asyncio  # optional: only needed for shared slots
+
+        self._redis = redis.asyncio
+        self.url = url
+        self.capacity = capacity
+        self.batch_max = batch_max
+        self.keys = [f"{key}:all", f"{key}:batch"]
+        self.ttl = ttl
+        self._clients = weakref.WeakKeyDictionary()  # redis.asyncio clients are loop-bound
+
+    def _client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = self._redis.from_url(self.url)
+        return client
+
+    async def acquire(self, lane: str, timeout: float | None) -> str:
+        """Wait for a slot and return its holder id; asyncio.TimeoutError after `timeout`."""
+        holder = uuid.uuid4().hex
+        deadline = None if timeout is None else time.monotonic() + timeout
+        delay = OLLAMA_SLOT_POLL
+        while True:
+            got = await self._client().eval(
+                self._ACQUIRE, 2, *self.keys, self.ttl, self.capacity, self.batch_max, lane, holder,
+            )
+            if got:
+                return holder
+            if deadline is not None and time.monotonic() + delay > deadline:
+                raise asyncio.TimeoutError
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    async def release(self, holder: str):
+        await self._client().zrem(self.keys[0], holder)
+        await self._client().zrem(self.keys[1], holder)
+
+
+def _shared_slots(url: str, capacity: int, batch_max: int) -> SharedSlots | None:
+    if not url:
+        return None
+    try:
+        return SharedSlots(url, capacity, batch_max)
+    except ImportError:
+        print("⚠️ redis is not installed; LLM admission caps apply per process only")
+        return None
+
+
+class AdmissionController:
+    """
+    Concurrency cap in front of Ollama with priority lanes.
+
+    Callers take a slot with `async with admission.slot(lane)`. If the lane
+    can't run now the caller queues (FIFO per lane); a bounded queue turns
+    overload into Saturated (HTTP 429 + Retry-After) instead of unbounded
+    waits. Slots and queues are kept per event loop (futures can't be
+    shared between loops), so each loop gets its own `capacity`.
+
+    With `shared` (SharedSlots), a locally admitted caller also takes a
+    slot from the cross-process budget before it runs, so the caps hold
+    across the API and every worker process. If Redis is unreachable the
+    caller runs on the local caps alone rather than failing.
+    """
+
+    def __init__(self, capacity: int = OLLAMA_MAX_CONCURRENCY, batch_max: int = OLLAMA_BATCH_MAX,
+                 queue_limits: dict | None = None, max_wait: dict | None = None,
+                 shared: SharedSlots | None = None):
+        self.capacity = capacity
+        self.batch_max = min(batch_max, capacity)
+        self.queue_limits = queue_limits or OLLAMA_QUEUE_LIMITS
+        self.max_wait = max_wait or OLLAMA_QUEUE_WAIT
+        self.shared = shared
+        self._avg_hold = 5.0  # seconds; EWMA of slot hold time, for Retry-After
+        self._loops = weakref.WeakKeyDictionary()
+
+    def _state(self) -> "_LoopState":
+        loop = asyncio.get_running_loop()
+        state = self._loops.get(loop)
+        if state is None:
+            state = self._loops[loop] = _LoopState()
+        return state
+
+    # ------------------------------
+    # State
+    # ------------------------------
+    def _has_room(self, state: "_LoopState", lane: str) -> bool:
+        if sum(state.in_use.values()) >= self.capacity:
+            return False
+        return lane != "batch" or state.in_use["batch"] < self.batch_max
+
+    def _retry_after(self, state: "_LoopState", lane: str) -> int:
+        return max(1, math.ceil(self._avg_hold * (state.waiters_ahead(lane) + 1) / self.capacity))
+
+    def stats(self) -> dict:
+        """Current loop's slots and queues."""
+        state = self._state()
+        return {
+            "capacity": self.capacity,
+            "batch_max": self.batch_max,
+            "in_use": dict(state.in_use),
+            "queued": {name: len(q) for name, q in state.queues.items()},
+            "avg_hold_s": round(self._avg_hold, 3),
+            "shared": self.shared is not None,
+        }
+
+    def check(self, lane: str | None = None):
+        """Raise Saturated now if a `lane` caller would be rejected (for streaming routes)."""
+        lane = lane or current_lane()
+        state = self._state()
+        if not self._has_room(state, lane) and len(state.queues[lane]) >= self.queue_limits[lane]:
+            LLM_REJECTED.labels(lane=lane).inc()
+            raise Saturated(lane, self._retry_after(state, lane))
+
+    # ------------------------------
+    # Slots
+    # ------------------------------
+    def _grant(self, state: "_LoopState", lane: str):
+        state.in_use[lane] += 1
+        LLM_SLOTS_IN_USE.labels(lane=lane).inc()
+
+    def _release(self, state: "_LoopState", lane: str, held: float):
+        state.in_use[lane] -= 1
+        LLM_SLOTS_IN_USE.labels(lane=lane).dec()
+        self._avg_hold = 0.8 * self._avg_hold + 0.2 * held
+        # hand free slots to waiters, interactive first
+        for name in LANES:
+            queue = state.queues[name]
+            while queue and self._has_room(state, name):
+                fut = queue.popleft()
+                LLM_QUEUE_DEPTH.labels(lane=name).dec()
+                if not fut.done():
+                    self._grant(state, name)
+                    fut.set_result(None)
+
+    async def _wait(self, state: "_LoopState", lane: str, timeout: float | None):
+        queue = state.queues[lane]
+        if len(queue) >= self.queue_limits[lane]:
+            LLM_REJECTED.labels(lane=lane).inc()
+            raise Saturated(lane, self._retry_after(state, lane))
+        fut = asyncio.get_running_loop().create_future()
+        queue.append(fut)
+        LLM_QUEUE_DEPTH.labels(lane=lane).inc()
+        try:
+            await asyncio.wait_for(fut, timeout)
+        except BaseException as e:
+            if fut.done() and not fut.cancelled():
+                # the slot was granted just as we gave up: hand it back
+                self._release(state, lane, 0.0)
+            elif fut in queue:
+                queue.remove(fut)
+                LLM_QUEUE_DEPTH.labels(lane=lane).dec()
+            if isinstance(e, asyncio.TimeoutError):
+                LLM_REJECTED.labels(lane=lane).inc()
+                raise Saturated(lane, self._retry_after(state, lane)) from None
+            raise
+
+    async def _acquire_shared(self, state: "_LoopState", lane: str, timeout: float | None) -> str | None:
+        try:
+            return await self.shared.acquire(lane, timeout)
+        except asyncio.TimeoutError:
+            LLM_REJECTED.labels(lane=lane).inc()
+            raise Saturated(lane, self._retry_after(state, lane)) from None
+        except Exception as e:
+            print(f"⚠️ Shared LLM slots unavailable, using local caps only: {e!r}")
+            return None
+
+    async def _release_shared(self, holder: str):
+        try:
+            await self.shared.release(holder)
+        except Exception as e:
+            # the holder expires after OLLAMA_SLOT_TTL anyway
+            print(f"⚠️ Could not release shared LLM slot: {e!r}")
+
+    @asynccontextmanager
+    async def slot(self, lane: str | None = None):
+        lane = lane or current_lane()
+        state = self._state()
+        queued_at = time.perf_counter()
+        max_wait = self.max_wait[lane]
+        if self._has_room(state, lane) and not state.waiters_ahead(lane):
+            self._grant(state, lane)
+        else:
+            await self._wait(state, lane, max_wait)
+
+        holder = None
+        if self.shared is not None:
+            # the cross-process wait shares the lane's max_wait budget
+            remaining = None if max_wait is None else max(0.0, max_wait - (time.perf_counter() - queued_at))
+            try:
+                holder = await self._acquire_shared(state, lane, remaining)
+            except BaseException:
+                self._release(state, lane, 0.0)
+                raise
+        started = time.perf_counter()
+        LLM_QUEUE_WAIT.labels(lane=lane).observe(started - queued_at)
+        try:
+            yield
+        finally:
+            if holder is not None:
+                await self._release_shared(holder)
+            self._release(state, lane, time.perf_counter() - started)
+
+
+class _LoopState:
+    """Slots held and waiters queued on one event loop."""
+
+    def __init__(self):
+        self.in_use = {name: 0 for name in LANES}
+        self.queues = {name: deque() for name in LANES}
+
+    def waiters_ahead(self, lane: str) -> int:
+        """Queued callers that would be served before a new `lane` caller."""
+        upto = LANES.index(lane)
+        return sum(len(self.queues[name]) for name in LANES[:upto + 1])
+
+
+admission = AdmissionController(
+    shared=_shared_slots(OLLAMA_ADMISSION_URL, OLLAMA_MAX_CONCURRENCY, OLLAMA_BATCH_MAX),
+)
@@ -1,34 +1,139 @@
-import httpx, os
-
-OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
-DEFAULT_MODEL = os.getenv("OLLAMA_MODEL", "llama3")
+import json
+import re
+from backend.services.llm import gateway, DEFAULT_MODEL
+from backend.services.cache import generation_cache, generation_key
+from backend.services.metrics import CAPTIONS
+from backend.services.hashtags import sample_or_none
 
 SYSTEM_PROMPT = """You are a social media copywriter for a nail salon.
 Return JSON with keys: caption (string), hashtags (string of up to 8 tags).
 Tone: high-energy, friendly, IG style. Add one local/geo hint if provided.
 """
 
-async def generate_caption_async(brief: str, categories: list[str] | None, city: str | None,
-                                 model: str | None = None):
-    model = model or DEFAULT_MODEL
+# used when the hashtags come from the hashtag bank instead of the model
+CAPTION_ONLY_SYSTEM_PROMPT = """You are a social media copywriter for a nail salon.
+Return JSON with key: caption (string). No hashtags.
+Tone: high-energy, friendly, IG style. Add one local/geo hint if provided.
+"""
+
+FALLBACK_RESULT = {"caption":"Fresh mani, fresh mood! 💅✨","hashtags":"#NailInspo #AzusaNails #SelfCare"}
+
+def build_caption_prompt(brief: str, categories: list[str] | None, city: str | None,
+                         with_hashtags: bool = True) -> str:
     user_prompt = f"""Brief: {brief or "Create a short nail-salon promotional post."}
 Categories: {", ".join(categories or [])}
 City: {city or ""}
 Return JSON only.
 """
-    async with httpx.AsyncClient(timeout=60) as client:
-        r = await client.post(f"{OLLAMA_URL}/api/generate", json={
-            "model": model,
-            "prompt": f"<system>{SYSTEM_PROMPT}</system>\n<user>{user_prompt}</user>",
-            "stream": False,
-            "temperature": 0.6,
-        })
-        r.raise_for_status()
-        data = r.json()
-        # Ollama returns {"response": "..."}
-        import json
+    system = SYSTEM_PROMPT if with_hashtags else CAPTION_ONLY_SYSTEM_PROMPT
+    return f"<system>{system}</system>\n<user>{user_prompt}</user>"
+
+def parse_caption(response: str) -> dict:
+    try:
+        return json.loads(response or "{}")
+    except Exception:
+        # fallback safe shape
+        return dict(FALLBACK_RESULT)
+
+async def generate_caption_async(brief: str, categories: list[str] | None, city: str | None,
+                                 model: str | None = None, timeout: float | None = None,
+                                 use_cache: bool = True, industry: str | None = None):
+    """
+    Identical (model, prompt) pairs are answered from generation_cache.
+    Pass use_cache=False to force a fresh completion (e.g. after a duplicate).
+    When the hashtag bank has (city, industry), the model only writes the
+    caption and the hashtags are sampled from the bank.
+    """
+    model = model or DEFAULT_MODEL
+    tags = sample_or_none(city, industry)
+    prompt = build_caption_prompt(brief, categories, city, with_hashtags=tags is None)
+    key = generation_key(model, prompt)
+    if use_cache:
+        cached = generation_cache.get(key)
+        if cached is not None:
+            CAPTIONS.labels(outcome="cache_hit").inc()
+            return {**cached, "hashtags": tags} if tags else dict(cached)
+
+    try:
+        response = await gateway.generate(prompt, model=model, temperature=0.6, timeout=timeout)
+    except Exception:
+        CAPTIONS.labels(outcome="error").inc()
+        raise
+    result = parse_caption(response)
+    # only cache real model output, never the fallback shape
+    if isinstance(result, dict) and result.get("caption") and result != FALLBACK_RESULT:
+        generation_cache.set(key, dict(result))
+        CAPTIONS.labels(outcome="generated").inc()
+    else:
+        CAPTIONS.labels(outcome="fallback").inc()
+    if tags and isinstance(result, dict):
+        result = {**result, "hashtags": tags}
+    return result
+
+def stream_caption(brief: str, categories: list[str] | None, city: str | None,
+                   model: str | None = None):
+    """Token stream for the same prompt; feed the joined text to parse_caption()."""
+    return gateway.stream_generate(
+        build_caption_prompt(brief, categories, city),
+        model=model or DEFAULT_MODEL, temperature=0.6,
+    )
+
+# ------------------------------
+# Multi-variant generation (monthly drafts)
+# ------------------------------
+VARIANTS_SYSTEM_PROMPT = """You are a social media copywriter for a nail salon.
+Return a JSON array of distinct posts, each an object with keys:
+caption (string), hashtags (string of up to 8 tags).
+Tone: high-energy, friendly, IG style. Vary the theme, hook and call to action
+between posts. Add a local/geo hint to some of them if a city is provided.
+"""
+
+def build_variants_prompt(n: int, brief: str, categories: list[str] | None, city: str | None,
+                          avoid: list[str] | None = None) -> str:
+    avoid_block = ""
+    if avoid:
+        avoid_block = "Do not repeat or closely paraphrase these captions:\n" + \
+            "\n".join(f"- {c}" for c in avoid) + "\n"
+    user_prompt = f"""Write {n} different posts.
+Brief: {brief or "A month of short nail-salon promotional posts."}
+Categories: {", ".join(categories or [])}
+City: {city or ""}
+{avoid_block}Return the JSON array only.
+"""
+    return f"<system>{VARIANTS_SYSTEM_PROMPT}</system>\n<user>{user_prompt}</user>"
+
+def parse_variants(response: str) -> list[dict]:
+    """Caption dicts from a JSON array reply; tolerates prose around it or a wrapping object."""
+    text = response or ""
+    try:
+        data = json.loads(text)
+    except Exception:
+        match = re.search(r"\[.*\]", text, re.S)
         try:
-            return json.loads(data.get("response", "{}"))
+            data = json.loads(match.group(0)) if match else []
         except Exception:
-            # fallback safe shape
-            return {"caption":"Fresh mani, fresh mood! 💅✨","hashtags":"#NailInspo #AzusaNails #SelfCare"}
\ No newline at end of file
+            data = []
+    if isinstance(data, dict):
+        data = next((v for v in data.values() if isinstance(v, list)), [data])
+    return [
+        {"caption": str(d["caption"]).strip(), "hashtags": str(d.get("hashtags") or "").strip()}
+        for d in data
+        if isinstance(d, dict) and d.get("caption")
+    ]
+
+async def generate_caption_variants_async(n: int, brief: str, categories: list[str] | None,
+                                          city: str | None, model: str | None = None,
+                                          avoid: list[str] | None = None,
+                                          timeout: float | None = None) -> list[dict]:
+    """Up to `n` caption/hashtag dicts from a single completion (may return fewer)."""
+    response = await gateway.generate(
+        build_variants_prompt(n, brief, categories, city, avoid),
+        model=model or DEFAULT_MODEL, temperature=0.9, timeout=timeout,
+    )
+    variants = parse_variants(response)
+    if variants:
+        CAPTIONS.labels(outcome="generated").inc(len(variants))
+    else:
+        CAPTIONS.labels(outcome="fallback").inc()
+    return variants[:n]
+
@@ -0,0 +1,63 @@
+import asyncio
+import threading
+
+# ------------------------------
+# Sync -> async bridge for Celery workers
+# ------------------------------
+# Pooled async clients (Ollama gateway, Graph API) are bound to the event
+# loop they were opened on. Workers start one long-lived loop per process
+# at boot so those pools survive between tasks; run_sync() submits work to it.
+
+_loop: asyncio.AbstractEventLoop | None = None
+_thread: threading.Thread | None = None
+_closers = []
+
+
+def register_pool(aclose):
+    """Register an async close() to call when the loop (or a one-off run) ends."""
+    if aclose not in _closers:
+        _closers.append(aclose)
+
+
+async def close_pools():
+    for aclose in _closers:
+        await aclose()
+
+
+def start_background_loop():
+    global _loop, _thread
+    if _loop is not None:
+        return
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, name="aio-background", daemon=True)
+    thread.start()
+    _loop, _thread = loop, thread
+
+
+def stop_background_loop():
+    global _loop, _thread
+    loop, thread = _loop, _thread
+    if loop is None:
+        return
+    asyncio.run_coroutine_threadsafe(close_pools(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=5)
+    loop.close()
+    _loop = _thread = None
+
+
+def run_sync(coro):
+    """
+    Run a coroutine from sync code. Uses the background loop when it is
+    running; otherwise falls back to a one-off loop and closes any pools
+    it opened before returning.
+    """
+    if _loop is not None:
+        return asyncio.run_coroutine_threadsafe(coro, _loop).result()
+
+    async def _once():
+        try:
+            return await coro
+        finally:
+            await close_pools()
+    return asyncio.run(_once())
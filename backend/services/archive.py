@@ -0,0 +1,156 @@
+import fcntl
+import gzip
+import json
+import os
+import re
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+
+# ------------------------------
+# Config
+# ------------------------------
+# Cold tier: <ARCHIVE_DIR>/<client_id>/<YYYY-MM>.json.gz, one file per client
+# per month of created_at. Only posted / failed posts older than
+# ARCHIVE_AFTER_DAYS move there; drafts and scheduled posts stay hot.
+ARCHIVE_DIR = os.path.abspath(os.getenv("ARCHIVE_DIR", "./archive"))
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_STATUSES = ("posted", "failed")
+ARCHIVE_COMPRESSLEVEL = int(os.getenv("ARCHIVE_COMPRESSLEVEL", "6"))
+# decoded partitions kept in memory for paging
+ARCHIVE_CACHE_SIZE = int(os.getenv("ARCHIVE_CACHE_SIZE", "64"))
+
+COLUMNS = ("id", "client_id", "caption", "hashtags", "image_url", "status",
+           "created_at", "scheduled_at", "posted_at")
+_DATETIMES = ("created_at", "scheduled_at", "posted_at")
+_MONTH_FILE = re.compile(r"^(\d{4}-\d{2})\.json\.gz$")
+
+
+def month_key(at: datetime) -> str:
+    return at.strftime("%Y-%m")
+
+
+def partition_path(client_id: int, month: str, root: str = ARCHIVE_DIR) -> str:
+    return os.path.join(root, str(client_id), f"{month}.json.gz")
+
+
+def months(client_id: int, root: str = ARCHIVE_DIR) -> list[str]:
+    """Archived months for a client, newest first."""
+    try:
+        names = os.listdir(os.path.join(root, str(client_id)))
+    except FileNotFoundError:
+        return []
+    return sorted((m.group(1) for m in map(_MONTH_FILE.match, names) if m), reverse=True)
+
+
+def month_end(month: str) -> datetime:
+    """First instant after `month` ("2025-03" -> 2025-04-01)."""
+    year, mon = map(int, month.split("-"))
+    return datetime(year + mon // 12, mon % 12 + 1, 1)
+
+
+# ------------------------------
+# Partition files
+# ------------------------------
+# A partition is gzip'd JSON laid out by column, {"columns": [...],
+# "data": {"caption": [...], ...}}, rows sorted newest first. Keeping each
+# column contiguous lets similar captions / hashtags compress together.
+def _encode(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def write_partition(path: str, rows: list[dict]):
+    rows = sorted(rows, key=lambda r: (r["created_at"], r["id"]), reverse=True)
+    doc = {"columns": list(COLUMNS), "data": {c: [_encode(r.get(c)) for r in rows] for c in COLUMNS}}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=ARCHIVE_COMPRESSLEVEL) as f:
+        json.dump(doc, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def read_partition(path: str) -> list[dict]:
+    """Rows of one partition (newest first); [] if it does not exist."""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return []
+    return _load(path, mtime)
+
+
+@lru_cache(maxsize=ARCHIVE_CACHE_SIZE)
+def _load(path: str, mtime: int) -> list[dict]:
+    # keyed on mtime so a rewritten partition is never served stale
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        doc = json.load(f)
+    data = doc["data"]
+    rows = [dict(zip(doc["columns"], values)) for values in zip(*(data[c] for c in doc["columns"]))]
+    for row in rows:
+        for c in _DATETIMES:
+            if row.get(c):
+                row[c] = datetime.fromisoformat(row[c])
+    return rows
+
+
+@contextmanager
+def archive_lock(root: str = ARCHIVE_DIR, blocking: bool = True):
+    """
+    Exclusive lock for writing partitions under `root` (flock on
+    <root>/.lock), held by a whole archive run. Yields False instead of
+    waiting when `blocking` is off and another run holds it.
+    """
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, ".lock"), "w") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def append_rows(client_id: int, month: str, rows: list[dict], root: str = ARCHIVE_DIR) -> int:
+    """
+    Merge rows into a partition (ids already there are replaced); returns
+    its row count. Read-modify-write: callers hold archive_lock().
+    """
+    path = partition_path(client_id, month, root)
+    merged = {r["id"]: r for r in read_partition(path)}
+    merged.update((r["id"], r) for r in rows)
+    write_partition(path, list(merged.values()))
+    return len(merged)
+
+
+# ------------------------------
+# Read-through
+# ------------------------------
+def newest_archived(client_id: int, root: str = ARCHIVE_DIR) -> datetime | None:
+    """Upper bound (exclusive) on created_at of anything archived for the client."""
+    found = months(client_id, root)
+    return month_end(found[0]) if found else None
+
+
+def archived_page(client_id: int, limit: int, before: tuple[datetime, int] | None = None,
+                  match=None, root: str = ARCHIVE_DIR) -> list[dict]:
+    """
+    Up to `limit` archived rows, newest first, strictly older than the
+    (created_at, id) keyset `before`, that pass `match(row)`. Only the
+    partitions the page reaches are opened.
+    """
+    out = []
+    for month in months(client_id, root):
+        if before and month > month_key(before[0]):
+            continue  # entirely newer than the cursor
+        for row in read_partition(partition_path(client_id, month, root)):
+            if before and (row["created_at"], row["id"]) >= before:
+                continue
+            if match and not match(row):
+                continue
+            out.append(row)
+            if len(out) >= limit:
+                return out
+    return out
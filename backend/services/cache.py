@@ -0,0 +1,191 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+from sqlalchemy import func, select
+
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1024"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(60 * 60)))
+CAPTION_INDEX_DEPTH = int(os.getenv("CAPTION_INDEX_DEPTH", "50"))
+# A client's captions are reloaded from the DB after this long (picks up
+# posts written by other processes), and at most this many clients are kept
+CAPTION_INDEX_TTL = float(os.getenv("CAPTION_INDEX_TTL", str(15 * 60)))
+CAPTION_INDEX_MAX_CLIENTS = int(os.getenv("CAPTION_INDEX_MAX_CLIENTS", "10000"))
+
+
+def hash_text(s: str) -> str:
+    return hashlib.sha256(s.strip().lower().encode()).hexdigest()
+
+
+def normalize_prompt(s: str) -> str:
+    return re.sub(r"\s+", " ", s).strip().lower()
+
+
+class TTLCache:
+    """
+    Size-bounded LRU with per-entry TTL and hit/miss counters.
+    Thread-safe: shared by request threads and the gateway's event loop.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                self.evictions += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: float | None = None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (ttl if ttl is not None else self.ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            return item[1] if item else default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+def generation_key(model: str, prompt: str) -> str:
+    """Cache key for one LLM call: model + normalized prompt."""
+    return hashlib.sha256(f"{model}\0{normalize_prompt(prompt)}".encode()).hexdigest()
+
+
+# Responses of identical (model, prompt) pairs
+generation_cache = TTLCache(maxsize=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL)
+
+
+class CaptionIndex:
+    """
+    Per-client set of hash_text() digests for the client's most recent
+    scheduled/posted captions, so a regenerated duplicate is caught with a
+    set lookup. Clients are loaded from the DB when first seen and again
+    once their entry is older than `ttl`; past `max_clients` the least
+    recently used client is dropped.
+    """
+
+    def __init__(self, depth: int = CAPTION_INDEX_DEPTH, ttl: float = CAPTION_INDEX_TTL,
+                 max_clients: int = CAPTION_INDEX_MAX_CLIENTS):
+        self.depth = depth
+        self.ttl = ttl
+        self.max_clients = max_clients
+        self._recent: dict[int, deque] = {}
+        self._sets: dict[int, set] = {}
+        self._loaded: OrderedDict = OrderedDict()  # client_id -> load time, LRU order
+        self._lock = threading.Lock()
+
+    def is_loaded(self, client_id: int) -> bool:
+        loaded_at = self._loaded.get(client_id)
+        return loaded_at is not None and time.monotonic() - loaded_at < self.ttl
+
+    def _push(self, recent: deque, seen: set, digest: str):
+        if digest in seen:
+            return
+        recent.append(digest)
+        seen.add(digest)
+        while len(recent) > self.depth:
+            seen.discard(recent.popleft())
+
+    def add(self, client_id: int, caption: str | None):
+        """Record a new caption for a loaded client (others read it from the DB when loaded)."""
+        if not caption:
+            return
+        digest = hash_text(caption)
+        with self._lock:
+            if client_id in self._loaded:
+                self._push(self._recent[client_id], self._sets[client_id], digest)
+
+    def is_duplicate(self, client_id: int, caption: str | None) -> bool:
+        if not caption:
+            return False
+        with self._lock:
+            if client_id in self._loaded:
+                self._loaded.move_to_end(client_id)
+            return hash_text(caption) in self._sets.get(client_id, ())
+
+    def _warm_query(self, client_ids):
+        from backend.models import Post
+
+        rn = func.row_number().over(
+            partition_by=Post.client_id,
+            order_by=(Post.created_at.desc(), Post.id.desc()),
+        ).label("rn")
+        ranked = (select(Post.client_id, Post.caption, rn)
+                    .where(Post.client_id.in_(client_ids),
+                           Post.status.in_(["scheduled", "posted"]))
+                    .subquery())
+        return (select(ranked.c.client_id, ranked.c.caption)
+                  .where(ranked.c.rn <= self.depth)
+                  .order_by(ranked.c.rn.desc()))
+
+    def _load(self, client_ids, rows):
+        fresh = {cid: (deque(), set()) for cid in client_ids}
+        for cid, caption in rows:
+            if caption:
+                self._push(*fresh[cid], hash_text(caption))
+        with self._lock:
+            now = time.monotonic()
+            for cid, (recent, seen) in fresh.items():
+                self._recent[cid], self._sets[cid] = recent, seen
+                self._loaded[cid] = now
+                self._loaded.move_to_end(cid)
+            while len(self._loaded) > self.max_clients:
+                cid, _ = self._loaded.popitem(last=False)
+                self._recent.pop(cid, None)
+                self._sets.pop(cid, None)
+
+    def warm(self, db, client_ids):
+        """(Re)load recent captions for every client missing or stale in the index (one query)."""
+        missing = [cid for cid in client_ids if not self.is_loaded(cid)]
+        if missing:
+            self._load(missing, db.execute(self._warm_query(missing)).all())
+
+    async def warm_async(self, db, client_ids):
+        """warm() for an AsyncSession."""
+        missing = [cid for cid in client_ids if not self.is_loaded(cid)]
+        if missing:
+            self._load(missing, (await db.execute(self._warm_query(missing))).all())
+
+
+caption_index = CaptionIndex()
@@ -0,0 +1,263 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from urllib.parse import urlencode
+
+import httpx
+
+from backend.services import aio
+from backend.services.cache import TTLCache
+from backend.services.images import sniff_type
+from backend.services.metrics import GRAPH_LATENCY, GRAPH_ERRORS, graph_error_code, observe_since
+
+# ------------------------------
+# Config
+# ------------------------------
+FB_API_URL = os.getenv("FB_API_URL", "https://graph.facebook.com/v24.0")
+
+GRAPH_TIMEOUT = float(os.getenv("GRAPH_TIMEOUT", "30"))
+GRAPH_CONNECT_TIMEOUT = float(os.getenv("GRAPH_CONNECT_TIMEOUT", "5"))
+GRAPH_MAX_CONNECTIONS = int(os.getenv("GRAPH_MAX_CONNECTIONS", "20"))
+GRAPH_MAX_KEEPALIVE = int(os.getenv("GRAPH_MAX_KEEPALIVE", "10"))
+# Tighter timeout for calls made while a user waits on a request
+GRAPH_INTERACTIVE_TIMEOUT = float(os.getenv("GRAPH_INTERACTIVE_TIMEOUT", "10"))
+
+# /me/accounts results, keyed by token digest
+GRAPH_ACCOUNTS_TTL = float(os.getenv("GRAPH_ACCOUNTS_TTL", "300"))
+GRAPH_ACCOUNTS_CACHE_SIZE = int(os.getenv("GRAPH_ACCOUNTS_CACHE_SIZE", "1024"))
+
+# Graph API accepts at most 50 operations per batch request
+GRAPH_BATCH_SIZE = min(int(os.getenv("GRAPH_BATCH_SIZE", "50")), 50)
+GRAPH_CONCURRENCY = int(os.getenv("GRAPH_CONCURRENCY", "4"))
+
+# Transport errors raised before the request reached Graph: nothing can have
+# been published, so the posts are safe to send again
+GRAPH_RETRYABLE = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# Per-page publishing rate (token bucket): sustained posts/sec and burst
+GRAPH_PAGE_RATE = float(os.getenv("GRAPH_PAGE_RATE", "1"))
+GRAPH_PAGE_BURST = float(os.getenv("GRAPH_PAGE_BURST", "5"))
+
+
+class GraphError(Exception):
+    def __init__(self, error: dict):
+        self.error = error
+        super().__init__(error.get("message") if isinstance(error, dict) else str(error))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class GraphClient:
+    """
+    Pooled async client for the Facebook Graph API, with one token bucket
+    per page id. Like the Ollama gateway, the pool is rebuilt if it is used
+    from a different event loop (the buckets' locks are loop-bound too).
+    """
+
+    def __init__(self, base_url: str = FB_API_URL):
+        self.base_url = base_url.rstrip("/")
+        self._client: httpx.AsyncClient | None = None
+        self._client_loop = None
+        self._buckets: dict[str, TokenBucket] = {}
+        aio.register_pool(self.aclose)
+
+    def client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(GRAPH_TIMEOUT, connect=GRAPH_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=GRAPH_MAX_CONNECTIONS,
+                    max_keepalive_connections=GRAPH_MAX_KEEPALIVE,
+                ),
+            )
+            self._client_loop = loop
+            self._buckets = {}
+        return self._client
+
+    async def startup(self):
+        self.client()
+
+    async def aclose(self):
+        client, self._client, self._client_loop = self._client, None, None
+        if client is not None and not client.is_closed:
+            await client.aclose()
+
+    def bucket(self, page_id: str) -> TokenBucket:
+        if page_id not in self._buckets:
+            self._buckets[page_id] = TokenBucket(GRAPH_PAGE_RATE, GRAPH_PAGE_BURST)
+        return self._buckets[page_id]
+
+    # ------------------------------
+    # Reads
+    # ------------------------------
+    async def get(self, path: str, params: dict | None = None, timeout: float | None = None) -> dict:
+        """
+        GET a Graph path and return the decoded JSON body. Graph reports
+        errors as {"error": {...}} with a 4xx status; those are returned
+        as-is rather than raised, so callers can surface the details.
+        """
+        started = time.perf_counter()
+        try:
+            r = await self.client().get(path, params=params,
+                                        timeout=timeout or httpx.USE_CLIENT_DEFAULT)
+            data = r.json()
+        except Exception as e:
+            GRAPH_ERRORS.labels(operation=path, code=graph_error_code(e)).inc()
+            raise
+        finally:
+            observe_since(GRAPH_LATENCY, started, operation=path)
+        if isinstance(data, dict) and "error" in data:
+            GRAPH_ERRORS.labels(operation=path, code=graph_error_code(data["error"])).inc()
+        return data
+
+    async def me_accounts(self, access_token: str, use_cache: bool = True) -> list[dict]:
+        """Pages managed by the token's user (/me/accounts "data"), cached per token."""
+        key = hashlib.sha256(access_token.encode()).hexdigest()
+        if use_cache:
+            pages = accounts_cache.get(key)
+            if pages is not None:
+                return pages
+
+        res = await self.get("/me/accounts", {"access_token": access_token},
+                             timeout=GRAPH_INTERACTIVE_TIMEOUT)
+        if "error" in res:
+            raise GraphError(res["error"])
+        pages = res.get("data", [])
+        accounts_cache.set(key, pages)
+        return pages
+
+    # ------------------------------
+    # Publishing
+    # ------------------------------
+    async def publish_batch(self, items: list[dict]) -> dict:
+        """
+        Publish up to GRAPH_BATCH_SIZE feed posts with one batch request.
+
+        items: [{"id": <post id>, "page_id": ..., "token": ..., "message": ...,
+                 "image_path": <local file, optional>, "image_url": <remote URL, optional>}]
+        Every item must belong to the same page: the batch's top-level token
+        is that page's token (see publish_many). Posts with an image go to
+        /photos: a local file is attached to the multipart request (typed by
+        its magic bytes) and streamed from disk, a remote URL is fetched by
+        Graph. Returns {post_id: (ok, graph_post_id_or_error)}.
+        """
+        # client() first: it resets the buckets when the loop changes
+        client = self.client()
+        await asyncio.gather(*(self.bucket(it["page_id"]).acquire() for it in items))
+
+        batch, files = [], {}
+        try:
+            for i, it in enumerate(items):
+                body = {"message": it["message"], "access_token": it["token"]}
+                op = {"method": "POST", "relative_url": f"{it['page_id']}/feed"}
+                if it.get("image_path"):
+                    name, path = f"file{i}", it["image_path"]
+                    with open(path, "rb") as f:
+                        mime = sniff_type(f.read(16)) or "application/octet-stream"
+                    files[name] = (os.path.basename(path), open(path, "rb"), mime)
+                    op.update(relative_url=f"{it['page_id']}/photos", attached_files=name)
+                elif it.get("image_url"):
+                    body["url"] = it["image_url"]
+                    op["relative_url"] = f"{it['page_id']}/photos"
+                op["body"] = urlencode(body)
+                batch.append(op)
+
+            started = time.perf_counter()
+            try:
+                r = await client.post("/", data={
+                    "access_token": items[0]["token"],
+                    "batch": json.dumps(batch),
+                    "include_headers": "false",
+                }, files=files or None)
+                r.raise_for_status()
+            except Exception as e:
+                code = str(e.response.status_code) if isinstance(e, httpx.HTTPStatusError) else graph_error_code(e)
+                GRAPH_ERRORS.labels(operation="batch", code=code).inc()
+                raise
+            finally:
+                observe_since(GRAPH_LATENCY, started, operation="batch")
+        finally:
+            for _, f, _ in files.values():
+                f.close()
+
+        data = r.json()
+        if not isinstance(data, list):
+            raise ValueError(f"unexpected batch response: {str(data)[:200]}")
+        results = {}
+        for it, res in zip(items, data):
+            if not res:
+                results[it["id"]] = (False, "no response (batch operation timed out)")
+                continue
+            try:
+                body = json.loads(res.get("body") or "{}")
+            except ValueError:
+                body = {}
+            if res.get("code") == 200 and body.get("id"):
+                results[it["id"]] = (True, body["id"])
+            else:
+                results[it["id"]] = (False, body.get("error") or f"HTTP {res.get('code')}")
+        for ok, detail in results.values():
+            if not ok:
+                GRAPH_ERRORS.labels(operation="publish", code=graph_error_code(detail)).inc()
+        return results
+
+    async def publish_many(self, items: list[dict]) -> dict:
+        """
+        Split items into per-page batch requests and send them concurrently
+        (GRAPH_CONCURRENCY at a time), so one page's expired token only
+        fails that page's posts.
+
+        A batch that never reached Graph (GRAPH_RETRYABLE) maps each of its
+        posts to (None, error) so callers can retry it. Any other failure
+        (4xx, read timeout, unreadable response) maps to (False, error):
+        Graph may already have published the posts, so they are not retried.
+        """
+        sem = asyncio.Semaphore(GRAPH_CONCURRENCY)
+
+        async def one(chunk):
+            async with sem:
+                try:
+                    return await self.publish_batch(chunk)
+                except GRAPH_RETRYABLE as e:
+                    return {it["id"]: (None, repr(e)) for it in chunk}
+                except Exception as e:
+                    return {it["id"]: (False, repr(e)) for it in chunk}
+
+        by_page = {}
+        for it in items:
+            by_page.setdefault(it["page_id"], []).append(it)
+        chunks = [
+            page_items[i:i + GRAPH_BATCH_SIZE]
+            for page_items in by_page.values()
+            for i in range(0, len(page_items), GRAPH_BATCH_SIZE)
+        ]
+        results = {}
+        for part in await asyncio.gather(*(one(c) for c in chunks)):
+            results.update(part)
+        return results
+
+
+accounts_cache = TTLCache(maxsize=GRAPH_ACCOUNTS_CACHE_SIZE, ttl=GRAPH_ACCOUNTS_TTL)
+graph = GraphClient()
@@ -0,0 +1,169 @@
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func
+
+from backend.services.llm import gateway, DEFAULT_MODEL
+from backend.services.metrics import HASHTAGS
+
+# ------------------------------
+# Config
+# ------------------------------
+HASHTAG_BANK_SIZE = int(os.getenv("HASHTAG_BANK_SIZE", "24"))      # ranked tags kept per combo
+HASHTAG_SAMPLE_SIZE = int(os.getenv("HASHTAG_SAMPLE_SIZE", "8"))   # tags handed out per request
+HASHTAG_BANK_TTL = float(os.getenv("HASHTAG_BANK_TTL", str(24 * 3600)))          # regenerate after
+HASHTAG_BANK_RELOAD = float(os.getenv("HASHTAG_BANK_RELOAD", "300"))             # re-read table after
+HASHTAG_REFRESH_BATCH = int(os.getenv("HASHTAG_REFRESH_BATCH", "200"))           # combos per job run
+HASHTAG_REFRESH_CONCURRENCY = int(os.getenv("HASHTAG_REFRESH_CONCURRENCY", "2"))
+
+_TAG = re.compile(r"#\w+", re.UNICODE)
+
+
+def bank_key(city: str | None, industry: str | None) -> tuple[str, str]:
+    norm = lambda s: re.sub(r"\s+", " ", (s or "")).strip().lower()
+    return norm(city), norm(industry)
+
+
+def parse_hashtags(text: str, limit: int = HASHTAG_BANK_SIZE) -> list[str]:
+    """Hashtags in order of appearance, deduplicated case-insensitively."""
+    seen, tags = set(), []
+    for tag in _TAG.findall(text or ""):
+        if tag.lower() not in seen:
+            seen.add(tag.lower())
+            tags.append(tag)
+    return tags[:limit]
+
+
+class HashtagBank:
+    """
+    In-memory copy of the hashtag_bank table. sample() is a dict lookup plus
+    a small random pick; the table is re-read at most every `reload_every`
+    seconds (ensure_fresh / ensure_fresh_async), never on the request path.
+    """
+
+    def __init__(self, reload_every: float = HASHTAG_BANK_RELOAD):
+        self.reload_every = reload_every
+        self._sets: dict[tuple[str, str], list[str]] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sets)
+
+    def _query(self):
+        from backend.models import HashtagSet
+        return select(HashtagSet.city, HashtagSet.industry, HashtagSet.hashtags)
+
+    def _replace(self, rows):
+        sets = {(city, industry): list(tags) for city, industry, tags in rows if tags}
+        with self._lock:
+            self._sets = sets
+            self._loaded_at = time.monotonic()
+
+    def is_stale(self) -> bool:
+        return time.monotonic() - self._loaded_at > self.reload_every
+
+    def ensure_fresh(self, db):
+        if self.is_stale():
+            self._replace(db.execute(self._query()).all())
+
+    async def ensure_fresh_async(self, db):
+        if self.is_stale():
+            self._replace((await db.execute(self._query())).all())
+
+    def put(self, city, industry, tags: list[str]):
+        with self._lock:
+            self._sets[bank_key(city, industry)] = list(tags)
+
+    def get(self, city, industry) -> list[str] | None:
+        return self._sets.get(bank_key(city, industry))
+
+    def sample(self, city, industry, k: int = HASHTAG_SAMPLE_SIZE) -> str | None:
+        """
+        "#a #b ..." for the pair, or None if it is not banked. The top half
+        of the ranking is always included; the rest is a random pick from
+        the remaining tags, so repeated posts don't carry identical sets.
+        """
+        tags = self.get(city, industry)
+        if not tags:
+            return None
+        k = min(k, len(tags))
+        head = k // 2
+        picked = tags[:head] + random.sample(tags[head:], k - head)
+        return " ".join(picked)
+
+
+hashtag_bank = HashtagBank()
+
+
+async def reload_forever(session_factory, every: float = HASHTAG_BANK_RELOAD):
+    """API background task: keep hashtag_bank in step with the table."""
+    while True:
+        try:
+            async with session_factory() as db:
+                await hashtag_bank.ensure_fresh_async(db)
+        except Exception as e:
+            print(f"⚠️ Hashtag bank reload failed: {e!r}")
+        await asyncio.sleep(every)
+
+
+def sample_or_none(city, industry) -> str | None:
+    """Bank sample for the request path; counts bank hits / misses."""
+    tags = hashtag_bank.sample(city, industry)
+    HASHTAGS.labels(source="bank" if tags else "live").inc()
+    return tags
+
+
+# ------------------------------
+# Refresh (background job)
+# ------------------------------
+def bank_prompt(city: str, industry: str, n: int = HASHTAG_BANK_SIZE) -> str:
+    return (
+        "You generate clean, relevant, local discovery hashtags. No filler.\n"
+        f"List {n} hashtags for a {industry or 'beauty'} business in {city or 'a US city'}, "
+        "most relevant first, mixing local, service and community tags. "
+        "Hashtags only, separated by spaces."
+    )
+
+
+def combos_to_refresh(db, now: datetime, ttl: float = HASHTAG_BANK_TTL,
+                      limit: int = HASHTAG_REFRESH_BATCH) -> list[tuple[str, str]]:
+    """(city, industry) pairs present in clients that are missing from the bank or older than `ttl`."""
+    from backend.models import Client, HashtagSet
+
+    pairs = {
+        bank_key(city, industry)
+        for city, industry in db.execute(
+            select(Client.city, Client.industry).distinct()
+            .where(func.coalesce(Client.city, "") != "")
+        )
+    }
+    fresh = {
+        (city, industry)
+        for city, industry in db.execute(
+            select(HashtagSet.city, HashtagSet.industry)
+            .where(HashtagSet.refreshed_at >= now - timedelta(seconds=ttl))
+        )
+    }
+    return sorted(pairs - fresh)[:limit]
+
+
+async def generate_sets(pairs, model: str = DEFAULT_MODEL,
+                        concurrency: int = HASHTAG_REFRESH_CONCURRENCY) -> dict[tuple[str, str], list[str]]:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(pair):
+        async with sem:
+            try:
+                text = await gateway.generate(bank_prompt(*pair), model=model, temperature=0.4)
+            except Exception as e:
+                print(f"⚠️ Hashtag generation failed for {pair}: {e!r}")
+                return pair, []
+            return pair, parse_hashtags(text)
+
+    return {pair: tags for pair, tags in await asyncio.gather(*(one(p) for p in pairs)) if tags}
@@ -0,0 +1,180 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import re
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+# ------------------------------
+# Config
+# ------------------------------
+# Content-addressed store: originals/<ab>/<sha256>, derived/<kind>/<ab>/<sha256>.jpg
+IMAGE_STORE_DIR = os.path.abspath(os.getenv("IMAGE_STORE_DIR", "./media"))
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(20 * 1024 * 1024)))
+IMAGE_CHUNK_SIZE = 64 * 1024
+# Derivative generation runs in a process pool (Pillow work is CPU-bound)
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+
+# kind -> (longest side in px, JPEG quality)
+DERIVATIVES = {
+    "fb": (int(os.getenv("IMAGE_FB_SIZE", "2048")), 85),
+    "thumb": (int(os.getenv("IMAGE_THUMB_SIZE", "320")), 80),
+}
+
+# Post.image_url for stored images is "/images/<sha256>"
+IMAGE_URL_PREFIX = "/images/"
+DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+# magic bytes of the formats we accept
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+
+class ImageError(ValueError):
+    pass
+
+
+def sniff_type(head: bytes) -> str | None:
+    for sig, mime in _SIGNATURES:
+        if head.startswith(sig):
+            return mime
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+# ------------------------------
+# Paths / URLs
+# ------------------------------
+def original_path(digest: str, root: str = IMAGE_STORE_DIR) -> str:
+    return os.path.join(root, "originals", digest[:2], digest)
+
+
+def derivative_path(digest: str, kind: str, root: str = IMAGE_STORE_DIR) -> str:
+    return os.path.join(root, "derived", kind, digest[:2], f"{digest}.jpg")
+
+
+def image_url(digest: str) -> str:
+    return f"{IMAGE_URL_PREFIX}{digest}"
+
+
+def digest_from_url(url: str | None) -> str | None:
+    """The sha256 of a stored image URL, or None for remote / empty URLs."""
+    if not url or not url.startswith(IMAGE_URL_PREFIX):
+        return None
+    digest = url[len(IMAGE_URL_PREFIX):].split("/")[0]
+    return digest if DIGEST_RE.match(digest) else None
+
+
+def publish_path(url: str | None) -> str | None:
+    """Local file to upload for a post image: the Facebook-sized derivative, else the original."""
+    digest = digest_from_url(url)
+    if not digest:
+        return None
+    for path in (derivative_path(digest, "fb"), original_path(digest)):
+        if os.path.exists(path):
+            return path
+    return None
+
+
+# ------------------------------
+# Ingest
+# ------------------------------
+async def ingest_stream(chunks, max_bytes: int = IMAGE_MAX_BYTES) -> tuple[str, int, bool]:
+    """
+    Stream an upload into the store while hashing it; nothing is held in
+    memory beyond one chunk. Returns (sha256, size, created) -- created is
+    False when identical bytes were already stored (the upload is dropped).
+    """
+    tmp_dir = os.path.join(IMAGE_STORE_DIR, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    tmp = os.path.join(tmp_dir, uuid.uuid4().hex)
+    sha, size, head = hashlib.sha256(), 0, b""
+    f = open(tmp, "wb")
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            size += len(chunk)
+            if size > max_bytes:
+                raise ImageError(f"image larger than {max_bytes} bytes")
+            if len(head) < 16:
+                head += chunk[:16]
+            sha.update(chunk)
+            await asyncio.to_thread(f.write, chunk)
+        f.close()
+        if not size:
+            raise ImageError("empty upload")
+        if not sniff_type(head):
+            raise ImageError("unsupported image type")
+
+        digest = sha.hexdigest()
+        dest = original_path(digest)
+        if os.path.exists(dest):
+            os.unlink(tmp)
+            return digest, size, False
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(tmp, dest)
+        return digest, size, True
+    except BaseException:
+        f.close()
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+# ------------------------------
+# Derivatives (process pool)
+# ------------------------------
+def build_derivatives(digest: str, root: str = IMAGE_STORE_DIR) -> list[str]:
+    """Render every missing derivative of one original. Runs in a pool process."""
+    from PIL import Image, ImageOps
+
+    missing = [k for k in DERIVATIVES if not os.path.exists(derivative_path(digest, k, root))]
+    if not missing:
+        return []
+    with Image.open(original_path(digest, root)) as src:
+        img = ImageOps.exif_transpose(src).convert("RGB")
+    for kind in missing:
+        size, quality = DERIVATIVES[kind]
+        out = img.copy()
+        out.thumbnail((size, size), Image.LANCZOS)
+        dest = derivative_path(digest, kind, root)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = f"{dest}.{uuid.uuid4().hex}.tmp"
+        out.save(tmp, "JPEG", quality=quality, optimize=True, progressive=True)
+        os.replace(tmp, dest)
+    return missing
+
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the API and Celery processes run threads (event
+        # loops, pools) whose locks a forked child could inherit held
+        _pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS,
+                                    mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+async def ensure_derivatives(digest: str) -> list[str]:
+    """Build missing derivatives in the process pool; each is only ever built once."""
+    if all(os.path.exists(derivative_path(digest, k)) for k in DERIVATIVES):
+        return []
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor(), build_derivatives, digest, IMAGE_STORE_DIR)
+
+
+def shutdown_pool():
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
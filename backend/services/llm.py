@@ -0,0 +1,309 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+
+import httpx
+
+from backend.services import aio
+from backend.services.admission import admission as default_admission, lane
+from backend.services.metrics import (
+    LLM_LATENCY, LLM_TOKENS, LLM_ERRORS, LLM_IN_FLIGHT, LLM_MODEL_LOADS, observe_since,
+)
+
+log = logging.getLogger(__name__)
+
+# ------------------------------
+# Config
+# ------------------------------
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+DEFAULT_MODEL = os.getenv("OLLAMA_MODEL", "llama3")
+
+# Per-call read timeout (how long a single completion may take)
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "60"))
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+
+# Connection pool
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "16"))
+OLLAMA_MAX_KEEPALIVE = int(os.getenv("OLLAMA_MAX_KEEPALIVE", "8"))
+OLLAMA_KEEPALIVE_EXPIRY = float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", "60"))
+
+# How long Ollama keeps a model resident after a request, and how many of
+# the most-used models a worker loads at startup
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_PRELOAD_MODELS = int(os.getenv("OLLAMA_PRELOAD_MODELS", "1"))
+# A load_duration above this means the model had to be (re)loaded
+OLLAMA_LOAD_EVENT_MS = float(os.getenv("OLLAMA_LOAD_EVENT_MS", "1000"))
+
+# Retry with jittered exponential backoff
+OLLAMA_RETRIES = int(os.getenv("OLLAMA_RETRIES", "2"))
+OLLAMA_BACKOFF_BASE = float(os.getenv("OLLAMA_BACKOFF_BASE", "0.25"))
+OLLAMA_BACKOFF_MAX = float(os.getenv("OLLAMA_BACKOFF_MAX", "4"))
+
+# Errors worth retrying. A read timeout is not: the model is just slow,
+# and trying again would only double the wait.
+RETRY_EXCEPTIONS = (
+    httpx.ConnectError,
+    httpx.ConnectTimeout,
+    httpx.PoolTimeout,
+    httpx.ReadError,
+    httpx.RemoteProtocolError,
+)
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def base_model_name(name: str) -> str:
+    """"llama3:latest" and "llama3" are the same model."""
+    return name[:-len(":latest")] if name and name.endswith(":latest") else name
+
+
+class OllamaGateway:
+    """
+    Single entry point for every Ollama call (/api/generate and /api/chat).
+
+    Holds one long-lived httpx.AsyncClient so connections are kept alive
+    and reused. An AsyncClient is bound to the event loop it was first used
+    on, so the gateway rebuilds it if it is called from a different loop.
+    Sync callers (Celery tasks) should go through aio.run_sync(), which uses
+    a background loop started at worker boot so the pool survives between tasks.
+
+    Every call first takes a slot from the admission controller, in the
+    caller's lane (admission.current_lane(): "interactive" in the API,
+    "batch" in Celery workers).
+    """
+
+    def __init__(self, base_url: str = OLLAMA_URL, model: str = DEFAULT_MODEL,
+                 timeout: float = OLLAMA_TIMEOUT, retries: int = OLLAMA_RETRIES,
+                 keep_alive: str = OLLAMA_KEEP_ALIVE, admission=default_admission):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.timeout = timeout
+        self.retries = retries
+        self.keep_alive = keep_alive
+        self.admission = admission
+        self._client: httpx.AsyncClient | None = None
+        self._client_loop = None
+        aio.register_pool(self.aclose)
+
+    # ------------------------------
+    # Pool lifecycle
+    # ------------------------------
+    def _build_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(self.timeout, connect=OLLAMA_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=OLLAMA_MAX_CONNECTIONS,
+                max_keepalive_connections=OLLAMA_MAX_KEEPALIVE,
+                keepalive_expiry=OLLAMA_KEEPALIVE_EXPIRY,
+            ),
+        )
+
+    def client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._client_loop is not loop:
+            self._client = self._build_client()
+            self._client_loop = loop
+        return self._client
+
+    async def startup(self):
+        """Open the pool on the current loop (FastAPI lifespan)."""
+        self.client()
+
+    async def aclose(self):
+        client, self._client, self._client_loop = self._client, None, None
+        if client is not None and not client.is_closed:
+            await client.aclose()
+
+    # ------------------------------
+    # Requests
+    # ------------------------------
+    def _backoff(self, attempt: int) -> float:
+        # "full jitter": uniform in [0, base * 2^attempt], capped
+        return random.uniform(0, min(OLLAMA_BACKOFF_MAX, OLLAMA_BACKOFF_BASE * (2 ** attempt)))
+
+    async def post(self, path: str, payload: dict, timeout: float | None = None) -> dict:
+        per_call = httpx.Timeout(timeout, connect=OLLAMA_CONNECT_TIMEOUT) if timeout else httpx.USE_CLIENT_DEFAULT
+        model = payload.get("model") or self.model
+        async with self.admission.slot():
+            with LLM_IN_FLIGHT.labels(model=model).track_inprogress():
+                return await self._post(path, payload, per_call, model)
+
+    async def _post(self, path: str, payload: dict, per_call, model: str) -> dict:
+        attempt = 0
+        first_started = time.perf_counter()
+        while True:
+            started = time.perf_counter()
+            try:
+                r = await self.client().post(path, json=payload, timeout=per_call)
+            except Exception as e:
+                if not isinstance(e, RETRY_EXCEPTIONS) or attempt >= self.retries:
+                    LLM_ERRORS.labels(endpoint=path, reason=type(e).__name__).inc()
+                    raise
+                error = repr(e)
+            else:
+                if r.status_code not in RETRY_STATUS or attempt >= self.retries:
+                    if r.is_error:
+                        LLM_ERRORS.labels(endpoint=path, reason=str(r.status_code)).inc()
+                    r.raise_for_status()
+                    log.debug("ollama %s %s took %.3fs", path, model, time.perf_counter() - started)
+                    data = r.json()
+                    observe_since(LLM_LATENCY, first_started, endpoint=path, model=model)
+                    self._record_usage(model, data)
+                    return data
+                error = f"HTTP {r.status_code}"
+
+            delay = self._backoff(attempt)
+            attempt += 1
+            log.warning("ollama %s failed (%s), retry %d/%d in %.2fs", path, error, attempt, self.retries, delay)
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _record_usage(model: str, data: dict):
+        # final (non-stream or done) responses carry token counts and load time (ns)
+        if data.get("prompt_eval_count"):
+            LLM_TOKENS.labels(model=model, kind="prompt").inc(data["prompt_eval_count"])
+        if data.get("eval_count"):
+            LLM_TOKENS.labels(model=model, kind="completion").inc(data["eval_count"])
+        if (data.get("load_duration") or 0) / 1e6 >= OLLAMA_LOAD_EVENT_MS:
+            LLM_MODEL_LOADS.labels(model=model).inc()
+
+    async def generate(self, prompt: str, model: str | None = None, *, temperature: float = 0.6,
+                       timeout: float | None = None, **extra) -> str:
+        """/api/generate — returns the raw response text."""
+        data = await self.post("/api/generate", {
+            "model": model or self.model,
+            "prompt": prompt,
+            "stream": False,
+            "options": {"temperature": temperature},
+            "keep_alive": self.keep_alive,
+            **extra,
+        }, timeout=timeout)
+        # Ollama returns {"response": "..."}
+        return data.get("response", "")
+
+    async def chat(self, messages: list[dict], model: str | None = None, *, temperature: float = 0.6,
+                   timeout: float | None = None, **extra) -> str:
+        """/api/chat — returns the assistant message content."""
+        data = await self.post("/api/chat", {
+            "model": model or self.model,
+            "messages": messages,
+            "stream": False,
+            "options": {"temperature": temperature},
+            "keep_alive": self.keep_alive,
+            **extra,
+        }, timeout=timeout)
+        # Response structure: { "message": { "content": "..." } }
+        return data["message"]["content"].strip()
+
+
+    # ------------------------------
+    # Model residency
+    # ------------------------------
+    async def loaded_models(self) -> set[str]:
+        """Models resident on the Ollama host right now (/api/ps); empty if unknown."""
+        try:
+            r = await self.client().get("/api/ps", timeout=OLLAMA_CONNECT_TIMEOUT)
+            r.raise_for_status()
+            return {base_model_name(m.get("name") or m.get("model") or "") for m in r.json().get("models", [])}
+        except (httpx.HTTPError, ValueError) as e:
+            log.debug("ollama /api/ps failed: %r", e)
+            return set()
+
+    async def affinity_order(self, counts: dict[str, int]) -> list[str]:
+        """
+        Order in which to run per-model groups of work: models already
+        resident first (no load), then the largest groups, so each model
+        is loaded at most once per batch.
+        """
+        loaded = await self.loaded_models()
+        return sorted(counts, key=lambda m: (base_model_name(m) not in loaded, -counts[m], m))
+
+    async def preload(self, models: list[str]):
+        """Load models ahead of time (an empty /api/generate) and keep them resident."""
+        for model in models:
+            try:
+                with lane("batch"):
+                    await self.post("/api/generate", {"model": model, "keep_alive": self.keep_alive})
+                log.info("ollama preloaded %s", model)
+            except (httpx.HTTPError, ValueError) as e:
+                log.warning("ollama preload of %s failed: %r", model, e)
+
+    # ------------------------------
+    # Streaming
+    # ------------------------------
+    async def stream(self, path: str, payload: dict, timeout: float | None = None):
+        """
+        POST with "stream": true and yield each NDJSON chunk as it arrives.
+        Retries are not attempted once the stream has started.
+        """
+        per_call = httpx.Timeout(timeout, connect=OLLAMA_CONNECT_TIMEOUT) if timeout else httpx.USE_CLIENT_DEFAULT
+        model = payload.get("model") or self.model
+        in_flight = LLM_IN_FLIGHT.labels(model=model)
+        # the slot is held until the stream ends
+        async with self.admission.slot():
+            started = time.perf_counter()
+            in_flight.inc()
+            try:
+                async with self.client().stream("POST", path, json={**payload, "stream": True}, timeout=per_call) as r:
+                    r.raise_for_status()
+                    async for line in r.aiter_lines():
+                        if line.strip():
+                            chunk = json.loads(line)
+                            if chunk.get("done"):
+                                observe_since(LLM_LATENCY, started, endpoint=path, model=model)
+                                self._record_usage(model, chunk)
+                            yield chunk
+            except Exception as e:
+                reason = str(e.response.status_code) if isinstance(e, httpx.HTTPStatusError) else type(e).__name__
+                LLM_ERRORS.labels(endpoint=path, reason=reason).inc()
+                raise
+            finally:
+                in_flight.dec()
+
+    async def stream_generate(self, prompt: str, model: str | None = None, *, temperature: float = 0.6,
+                              timeout: float | None = None, **extra):
+        """/api/generate, yielding response text fragments."""
+        async for chunk in self.stream("/api/generate", {
+            "model": model or self.model,
+            "prompt": prompt,
+            "options": {"temperature": temperature},
+            "keep_alive": self.keep_alive,
+            **extra,
+        }, timeout=timeout):
+            if chunk.get("response"):
+                yield chunk["response"]
+
+    async def stream_chat(self, messages: list[dict], model: str | None = None, *, temperature: float = 0.6,
+                          timeout: float | None = None, **extra):
+        """/api/chat, yielding assistant content fragments."""
+        async for chunk in self.stream("/api/chat", {
+            "model": model or self.model,
+            "messages": messages,
+            "options": {"temperature": temperature},
+            "keep_alive": self.keep_alive,
+            **extra,
+        }, timeout=timeout):
+            content = (chunk.get("message") or {}).get("content")
+            if content:
+                yield content
+
+
+gateway = OllamaGateway()
+
+
+def preload_popular_models(limit: int = OLLAMA_PRELOAD_MODELS):
+    """Preload the `limit` most common Client.model_name values (worker startup)."""
+    if limit <= 0:
+        return
+    from sqlalchemy import func
+    from backend.database import SessionLocal
+    from backend.models import Client
+
+    name = func.coalesce(Client.model_name, DEFAULT_MODEL)
+    with SessionLocal() as db:
+        rows = db.query(name, func.count()).group_by(name).order_by(func.count().desc()).limit(limit).all()
+    aio.run_sync(gateway.preload([m for m, _ in rows] or [DEFAULT_MODEL]))
+
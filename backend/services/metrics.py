@@ -0,0 +1,162 @@
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY,
+    generate_latest, multiprocess, start_http_server,
+)
+
+# ------------------------------
+# Config
+# ------------------------------
+# With several processes (uvicorn --workers, Celery prefork) set
+# PROMETHEUS_MULTIPROC_DIR to an empty shared directory; every process then
+# writes its samples there and the exporters aggregate them.
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+# Port of the Celery worker exporter (0 disables it). Without
+# PROMETHEUS_MULTIPROC_DIR each prefork child serves its own samples on
+# WORKER_METRICS_PORT + <child index> (1, 2, ...)
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9808"))
+
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 120)
+PASS_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# ------------------------------
+# HTTP
+# ------------------------------
+HTTP_LATENCY = Histogram(
+    "willdev_http_request_duration_seconds",
+    "API request latency (time to response headers for streams)",
+    ["method", "route", "status"],
+)
+
+# ------------------------------
+# Celery tasks
+# ------------------------------
+TASK_DURATION = Histogram(
+    "willdev_task_duration_seconds", "Celery task run time", ["task"],
+    buckets=(0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+TASK_OUTCOMES = Counter("willdev_task_runs", "Celery task runs by final state", ["task", "state"])
+
+# ------------------------------
+# Ollama
+# ------------------------------
+LLM_LATENCY = Histogram(
+    "willdev_llm_request_duration_seconds", "Ollama call latency, retries included",
+    ["endpoint", "model"], buckets=LLM_BUCKETS,
+)
+LLM_TOKENS = Counter("willdev_llm_tokens", "Tokens reported by Ollama", ["model", "kind"])
+LLM_ERRORS = Counter("willdev_llm_errors", "Failed Ollama calls (after retries)", ["endpoint", "reason"])
+LLM_IN_FLIGHT = Gauge(
+    "willdev_llm_in_flight", "Ollama calls currently in flight per model", ["model"],
+    multiprocess_mode="livesum",
+)
+LLM_MODEL_LOADS = Counter(
+    "willdev_llm_model_loads", "Calls that had to load the model first (load_duration over threshold)", ["model"],
+)
+CAPTIONS = Counter(
+    "willdev_captions", "generate_caption_async results (cache_hit / generated / fallback / error)",
+    ["outcome"],
+)
+
+# Admission control in front of Ollama (backend/services/admission.py)
+LLM_QUEUE_DEPTH = Gauge(
+    "willdev_llm_queue_depth", "Calls waiting for an Ollama slot per lane", ["lane"],
+    multiprocess_mode="livesum",
+)
+LLM_QUEUE_WAIT = Histogram(
+    "willdev_llm_queue_wait_seconds", "Time spent waiting for an Ollama slot", ["lane"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+LLM_SLOTS_IN_USE = Gauge(
+    "willdev_llm_slots_in_use", "Ollama slots held per lane", ["lane"], multiprocess_mode="livesum",
+)
+LLM_REJECTED = Counter("willdev_llm_rejected", "Calls turned away by admission control (429)", ["lane"])
+
+HASHTAGS = Counter("willdev_hashtags", "Hashtag requests by source (bank / live)", ["source"])
+
+# ------------------------------
+# Graph API
+# ------------------------------
+GRAPH_LATENCY = Histogram("willdev_graph_request_duration_seconds", "Graph API call latency", ["operation"])
+GRAPH_ERRORS = Counter("willdev_graph_errors", "Graph API errors by error code", ["operation", "code"])
+
+# ------------------------------
+# Scheduler
+# ------------------------------
+SCHEDULER_PASS = Histogram(
+    "willdev_scheduler_pass_clients",
+    "Clients per ai_daily_scheduler pass, by stage (scanned / eligible / scheduled / quota_skipped / fallback_caption)",
+    ["stage"], buckets=PASS_BUCKETS,
+)
+
+
+def observe_since(histogram, started: float, **labels):
+    histogram.labels(**labels).observe(time.perf_counter() - started)
+
+
+def graph_error_code(error) -> str:
+    """Label for a Graph error body ({"code": 190, ...}), HTTP status or exception."""
+    if isinstance(error, dict):
+        return str(error.get("code", "unknown"))
+    if isinstance(error, BaseException):
+        return type(error).__name__
+    text = str(error or "")
+    return text[5:] if text.startswith("HTTP ") else "unknown"
+
+
+def observe_scheduler_pass(**stages: int):
+    for stage, n in stages.items():
+        SCHEDULER_PASS.labels(stage=stage).observe(n)
+
+
+# ------------------------------
+# Exposition
+# ------------------------------
+def collect_registry():
+    """Registry to expose: the shared multiprocess view if configured, else this process."""
+    if not MULTIPROC_DIR:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render() -> tuple[bytes, str]:
+    return generate_latest(collect_registry()), CONTENT_TYPE_LATEST
+
+
+def start_worker_exporter(port: int = WORKER_METRICS_PORT):
+    """
+    Serve /metrics for a Celery worker on `port`. Called once in the worker's
+    main process; it includes the prefork children only when
+    PROMETHEUS_MULTIPROC_DIR is set (otherwise see start_child_exporter).
+    """
+    if not port:
+        return
+    _serve(port)
+
+
+def start_child_exporter(index: int | None, port: int = WORKER_METRICS_PORT):
+    """
+    Serve a prefork child's own samples on `port + index`, where tasks
+    actually record them. Not needed (and skipped) with
+    PROMETHEUS_MULTIPROC_DIR, where the main exporter aggregates children.
+    """
+    if not port or MULTIPROC_DIR or index is None:
+        return
+    _serve(port + index)
+
+
+def _serve(port: int):
+    try:
+        start_http_server(port, registry=collect_registry())
+        print(f"📈 Worker metrics on :{port}")
+    except OSError as e:
+        print(f"⚠️ Could not start worker metrics exporter on :{port}: {e!r}")
+
+
+def mark_process_dead(pid: int):
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
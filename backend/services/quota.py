@@ -0,0 +1,156 @@
+from datetime import date, timedelta
+
+from sqlalchemy import select, func, insert, literal, literal_column, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from backend.models import Client, SubscriptionPlan, ClientSubscription, WeeklyUsage
+
+DEFAULT_WEEKLY_LIMIT = 3
+
+# dialect name -> INSERT construct that supports ON CONFLICT ... RETURNING
+_UPSERT_INSERT = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+
+def week_start_today():
+    today = date.today()
+    return today - timedelta(days=today.weekday())  # Monday
+
+
+def weekly_limit_expr(client_id_col):
+    """
+    SQL expression for a client's weekly post limit, correlated on
+    `client_id_col`: first subscription's plan, else the "free" plan, else 3.
+    """
+    subscribed = (
+        select(SubscriptionPlan.weekly_post_limit)
+        .join(ClientSubscription, ClientSubscription.plan_id == SubscriptionPlan.id)
+        .where(ClientSubscription.client_id == client_id_col)
+        .order_by(ClientSubscription.id.asc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    free = (
+        select(SubscriptionPlan.weekly_post_limit)
+        .where(SubscriptionPlan.name == "free")
+        .limit(1)
+        .scalar_subquery()
+    )
+    return func.coalesce(subscribed, free, DEFAULT_WEEKLY_LIMIT)
+
+
+def remaining_slots(db, client_ids, week_start: date) -> dict[int, int]:
+    """Read-only view of how many posts each client may still make this week."""
+    if not client_ids:
+        return {}
+    rows = db.execute(
+        select(
+            Client.id,
+            weekly_limit_expr(Client.id) - func.coalesce(WeeklyUsage.posts_made, 0),
+        )
+        .outerjoin(WeeklyUsage, (WeeklyUsage.client_id == Client.id)
+                   & (WeeklyUsage.week_start == week_start))
+        .where(Client.id.in_(list(client_ids)))
+    ).all()
+    return {cid: remaining for cid, remaining in rows}
+
+
+def reserve_slots(db, client_ids, week_start: date) -> set[int]:
+    """
+    Take one post slot for each client that still has quota this week, in a
+    single statement:
+
+        INSERT INTO weekly_usage (client_id, week_start, posts_made)
+        SELECT id, :week, 1 FROM clients WHERE id IN (...) AND <limit> >= 1
+        ON CONFLICT (client_id, week_start) DO UPDATE
+            SET posts_made = posts_made + 1 WHERE posts_made < <limit>
+        RETURNING client_id
+
+    Only rows that were inserted or actually incremented come back, so two
+    workers racing on the same client can never both get the last slot.
+    Dialects without ON CONFLICT ... RETURNING use _reserve_slots_each.
+    Runs in the caller's transaction; the caller commits.
+    """
+    client_ids = list(client_ids)
+    if not client_ids:
+        return set()
+
+    upsert = _UPSERT_INSERT.get(db.get_bind().dialect.name)
+    if upsert is None:
+        return _reserve_slots_each(db, client_ids, week_start)
+
+    source = (
+        select(Client.id, literal(week_start, WeeklyUsage.week_start.type), literal(1))
+        .where(Client.id.in_(client_ids), weekly_limit_expr(Client.id) >= 1)
+    )
+    stmt = (
+        upsert(WeeklyUsage)
+        .from_select(["client_id", "week_start", "posts_made"], source)
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[WeeklyUsage.client_id, WeeklyUsage.week_start],
+        set_={"posts_made": WeeklyUsage.posts_made + 1},
+        # ON CONFLICT ... WHERE has no enclosing SELECT to correlate against,
+        # so the conflicting row's column is referenced by name
+        where=WeeklyUsage.posts_made < weekly_limit_expr(literal_column("weekly_usage.client_id")),
+    ).returning(WeeklyUsage.client_id)
+    return {row[0] for row in db.execute(stmt)}
+
+
+def release_slots(db, client_ids, week_start: date):
+    """Hand back one slot per client taken by reserve_slots() but not used."""
+    client_ids = list(client_ids)
+    if client_ids:
+        db.execute(
+            update(WeeklyUsage)
+            .where(WeeklyUsage.client_id.in_(client_ids), WeeklyUsage.week_start == week_start,
+                   WeeklyUsage.posts_made > 0)
+            .values(posts_made=WeeklyUsage.posts_made - 1)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def _reserve_slots_each(db, client_ids, week_start: date) -> set[int]:
+    """
+    Portable reserve_slots(), a few statements per client: a conditional
+    UPDATE ... WHERE posts_made < limit, then an INSERT if the client has
+    no row this week yet. A concurrent insert of the same row hits the
+    unique index; the UPDATE is then retried once.
+    """
+    limits = dict(db.execute(
+        select(Client.id, weekly_limit_expr(Client.id)).where(Client.id.in_(client_ids))
+    ).all())
+
+    def bump(cid):
+        return db.execute(
+            update(WeeklyUsage)
+            .where(WeeklyUsage.client_id == cid, WeeklyUsage.week_start == week_start,
+                   WeeklyUsage.posts_made < limits[cid])
+            .values(posts_made=WeeklyUsage.posts_made + 1)
+            .execution_options(synchronize_session=False)
+        ).rowcount == 1
+
+    reserved = set()
+    for cid in client_ids:
+        if cid not in limits or limits[cid] < 1:
+            continue
+        if bump(cid):
+            reserved.add(cid)
+            continue
+        exists = db.execute(
+            select(WeeklyUsage.id)
+            .where(WeeklyUsage.client_id == cid, WeeklyUsage.week_start == week_start)
+        ).first()
+        if exists:
+            continue  # at the limit
+        try:
+            with db.begin_nested():
+                db.execute(insert(WeeklyUsage).values(client_id=cid, week_start=week_start, posts_made=1))
+            reserved.add(cid)
+        except IntegrityError:
+            if bump(cid):
+                reserved.add(cid)
+    return reserved
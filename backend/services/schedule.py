@@ -0,0 +1,93 @@
+import os
+from datetime import datetime, timedelta, date
+from zoneinfo import ZoneInfo
+
+DEFAULT_TZ = "America/Los_Angeles"
+DEFAULT_HOUR = 17
+DEFAULT_MINUTE = 0
+
+# Safety-net sweep period; exact firing comes from ETA tasks
+SCHEDULER_SWEEP_SECONDS = int(os.getenv("SCHEDULER_SWEEP_SECONDS", "60"))
+
+# Sharded passes: clients are split by id into at most SCHEDULER_SHARDS
+# shards (one Celery task each), adding a shard per SCHEDULER_SHARD_SIZE clients
+SCHEDULER_SHARDS = int(os.getenv("SCHEDULER_SHARDS", "8"))
+SCHEDULER_SHARD_SIZE = int(os.getenv("SCHEDULER_SHARD_SIZE", "250"))
+# A claimed client is skipped by other runs until its lease expires. A
+# round that outlasts it only writes the clients it still holds (the lease
+# is renewed before the writes, see publish.renew_leases)
+SCHEDULER_LEASE_SECONDS = int(os.getenv("SCHEDULER_LEASE_SECONDS", "900"))
+
+UTC = ZoneInfo("UTC")
+
+
+def _wall_time(day: date, hour: int, minute: int, tz: ZoneInfo) -> datetime:
+    """Naive UTC datetime for local wall time `hour:minute` on `day` in `tz`."""
+    local = datetime(day.year, day.month, day.day, hour, minute, tzinfo=tz)
+    return local.astimezone(UTC).replace(tzinfo=None)
+
+
+def client_post_time(client) -> tuple[ZoneInfo, int, int]:
+    return (
+        ZoneInfo(client.timezone or DEFAULT_TZ),
+        client.post_time_hour if client.post_time_hour is not None else DEFAULT_HOUR,
+        client.post_time_minute if client.post_time_minute is not None else DEFAULT_MINUTE,
+    )
+
+
+def local_today(client, now_utc: datetime | None = None) -> date:
+    tz, _, _ = client_post_time(client)
+    now_utc = now_utc or datetime.now(UTC)
+    if now_utc.tzinfo is None:
+        now_utc = now_utc.replace(tzinfo=UTC)
+    return now_utc.astimezone(tz).date()
+
+
+def fire_time_today(client, now_utc: datetime | None = None) -> datetime:
+    """
+    The client's post time on its local "today" (may already be past, in
+    which case the client is due straight away; the scheduler then skips it
+    if it already has a post today).
+    """
+    tz, hour, minute = client_post_time(client)
+    return _wall_time(local_today(client, now_utc), hour, minute, tz)
+
+
+def fire_time_after_today(client, now_utc: datetime | None = None) -> datetime:
+    """The client's post time on its local "tomorrow" — set once today is handled."""
+    tz, hour, minute = client_post_time(client)
+    return _wall_time(local_today(client, now_utc) + timedelta(days=1), hour, minute, tz)
+
+
+def local_day_bounds(client, day: date) -> tuple[datetime, datetime]:
+    """Naive UTC [start, end) of the client's local calendar day `day`."""
+    tz, _, _ = client_post_time(client)
+    return _wall_time(day, 0, 0, tz), _wall_time(day + timedelta(days=1), 0, 0, tz)
+
+
+def shard_count(clients: int) -> int:
+    """Shards for a pass over `clients` clients (1 = run inline)."""
+    return max(1, min(SCHEDULER_SHARDS, -(-clients // SCHEDULER_SHARD_SIZE)))
+
+
+def in_shard(column, shard: int, shards: int):
+    """SQL filter selecting shard `shard` of `shards` by an integer client id column."""
+    return column % shards == shard
+
+
+def dispatch_at(client_ids: list[int], eta: datetime):
+    """
+    Ask Celery to run the scheduler for these clients at `eta` (naive UTC).
+    Best effort: if the broker is unreachable the periodic sweep still
+    picks the clients up.
+    """
+    try:
+        from worker.celery_app import celery
+        celery.send_task(
+            "worker.tasks.publish.ai_daily_scheduler",
+            kwargs={"client_ids": list(client_ids)},
+            eta=eta.replace(tzinfo=UTC),
+            retry=False,
+        )
+    except Exception as e:
+        print(f"⚠️ Could not enqueue scheduler run for {client_ids} at {eta}: {e!r}")
@@ -0,0 +1,126 @@
+"""
+Opt-in SQL profiling on SQLAlchemy engine events (SQL_PROFILE=1).
+
+Every statement is timed. Statements slower than SQL_SLOW_MS are logged
+with their parameters. Inside a profile() block (one per API request /
+Celery task) statements are also counted and grouped by shape; a shape
+repeated SQL_NPLUSONE_THRESHOLD times or more is reported as a likely
+N+1 loop.
+"""
+import logging
+import os
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+log = logging.getLogger(__name__)
+
+# ------------------------------
+# Config
+# ------------------------------
+SQL_PROFILE = os.getenv("SQL_PROFILE", "0") == "1"
+SQL_SLOW_MS = float(os.getenv("SQL_SLOW_MS", "100"))
+SQL_NPLUSONE_THRESHOLD = int(os.getenv("SQL_NPLUSONE_THRESHOLD", "5"))
+SQL_PARAMS_MAX_CHARS = 500
+
+_current: ContextVar["QueryProfile | None"] = ContextVar("sql_profile", default=None)
+
+# "IN (?, ?, ?)" / "IN (%(p_1)s, %(p_2)s)" -> "IN (?...)" so batches of any size share a shape
+_IN_LIST = re.compile(r"\(\s*(?:\?|%\(\w+\)s|:\w+|\$\d+)(?:\s*,\s*(?:\?|%\(\w+\)s|:\w+|\$\d+))+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    return _SPACE.sub(" ", _IN_LIST.sub("(?...)", statement)).strip()
+
+
+class QueryProfile:
+    def __init__(self, label: str):
+        self.label = label
+        self.statements = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement: str, elapsed: float):
+        self.statements += 1
+        self.seconds += elapsed
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold: int = SQL_NPLUSONE_THRESHOLD) -> list[tuple[str, int]]:
+        """Statement shapes run `threshold`+ times: likely N+1 loops."""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+    @property
+    def db_ms(self) -> float:
+        return round(self.seconds * 1000, 2)
+
+    def headers(self) -> dict[str, str]:
+        return {
+            "X-DB-Queries": str(self.statements),
+            "X-DB-Time-Ms": str(self.db_ms),
+            "X-DB-Repeated": str(len(self.repeated())),
+        }
+
+    def log_summary(self):
+        log.info("sql %s: %d statements, %.2f ms", self.label, self.statements, self.db_ms)
+        for shape, n in self.repeated():
+            log.warning("sql %s: possible N+1, %dx %s", self.label, n, shape[:300])
+
+
+@contextmanager
+def profile(label: str):
+    """Collect statement stats for everything run in this context."""
+    prof = QueryProfile(label)
+    token = _current.set(prof)
+    try:
+        yield prof
+    finally:
+        _current.reset(token)
+        prof.log_summary()
+
+
+def current() -> "QueryProfile | None":
+    return _current.get()
+
+
+# ------------------------------
+# Engine hooks
+# ------------------------------
+def _before(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("sqlprofile_started", []).append(time.perf_counter())
+
+
+def _after(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["sqlprofile_started"].pop()
+    if elapsed * 1000 >= SQL_SLOW_MS:
+        params = repr(parameters)
+        if len(params) > SQL_PARAMS_MAX_CHARS:
+            params = params[:SQL_PARAMS_MAX_CHARS] + "..."
+        log.warning("slow sql (%.1f ms): %s | params=%s", elapsed * 1000, _SPACE.sub(" ", statement), params)
+    prof = _current.get()
+    if prof is not None:
+        prof.record(statement, elapsed)
+
+
+def _on_error(exception_context):
+    started = exception_context.connection.info.get("sqlprofile_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def instrument(engine):
+    """Attach the profiling listeners to `engine` (no-op unless SQL_PROFILE=1)."""
+    if not SQL_PROFILE:
+        return engine
+    if not log.handlers and not logging.getLogger().handlers:
+        log.addHandler(logging.StreamHandler())
+    if log.level == logging.NOTSET:
+        log.setLevel(logging.INFO)
+    event.listen(engine, "before_cursor_execute", _before)
+    event.listen(engine, "after_cursor_execute", _after)
+    event.listen(engine, "handle_error", _on_error)
+    return engine
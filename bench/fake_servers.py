@@ -0,0 +1,210 @@
+"""
+Local stand-ins for Ollama and the Facebook Graph API, for benchmarks.
+
+Both are stdlib ThreadingHTTPServers with a configurable per-request
+latency, so the app can be pointed at them via OLLAMA_URL / FB_API_URL.
+
+    python -m bench.fake_servers --ollama-port 11500 --graph-port 11600 --latency-ms 200
+"""
+import argparse
+import itertools
+import json
+import re
+import threading
+import time
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CAPTION = {"caption": "Fresh set, fresh week ✨ Book your spot in Azusa.", "hashtags": "#NailInspo #AzusaNails"}
+_variant_ids = itertools.count(1)
+
+
+def _reply_text(path: str, req: dict) -> str:
+    if path != "/api/generate":
+        return CAPTION["caption"]
+    # multi-variant prompts ("Write N different posts") get a JSON array
+    many = re.search(r"Write (\d+) different posts", req.get("prompt", ""))
+    if many:
+        return json.dumps([
+            {"caption": f"Look #{next(_variant_ids)} of the month ✨ Book now.", "hashtags": CAPTION["hashtags"]}
+            for _ in range(int(many.group(1)))
+        ])
+    return json.dumps(CAPTION)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    latency = 0.0
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send_json(self, data, status: int = 200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_ndjson(self, chunks):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for chunk in chunks:
+            line = (json.dumps(chunk) + "\n").encode()
+            self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class OllamaHandler(_Handler):
+    """
+    /api/generate and /api/chat, streaming or not, plus /api/ps. Keeps
+    `max_loaded` models resident; a request for any other model first
+    sleeps `swap_latency` (a model load) and reports it as load_duration.
+    """
+    swap_latency = 0.0
+    max_loaded = 1
+    resident = []
+    resident_lock = threading.Lock()
+
+    def _load(self, model: str) -> int:
+        with self.resident_lock:
+            if model in self.resident:
+                self.resident.remove(model)
+                self.resident.append(model)
+                return 0
+            time.sleep(self.swap_latency)
+            self.resident.append(model)
+            del self.resident[:-self.max_loaded]
+            return int(self.swap_latency * 1e9)
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/api/ps":
+            return self._send_json({"models": [{"name": f"{m}:latest", "model": f"{m}:latest"}
+                                               for m in self.resident]})
+        self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        req = json.loads(self._read_body() or b"{}")
+        load_ns = self._load(req.get("model") or "llama3")
+        time.sleep(self.latency)
+        path = urlparse(self.path).path
+        if path == "/api/generate" and not req.get("prompt"):
+            # preload request
+            return self._send_json({"model": req.get("model"), "response": "", "done": True,
+                                    "load_duration": load_ns})
+        text = _reply_text(path, req)
+
+        if req.get("stream"):
+            words = text.split(" ")
+            pieces = [w + (" " if i < len(words) - 1 else "") for i, w in enumerate(words)]
+            if path == "/api/generate":
+                chunks = [{"response": p, "done": False} for p in pieces]
+            else:
+                chunks = [{"message": {"role": "assistant", "content": p}, "done": False} for p in pieces]
+            chunks.append({"done": True, "eval_count": len(pieces), "prompt_eval_count": 32,
+                           "load_duration": load_ns})
+            return self._send_ndjson(chunks)
+
+        if path == "/api/generate":
+            return self._send_json({"model": req.get("model"), "response": text, "done": True,
+                                    "eval_count": len(text.split()), "prompt_eval_count": 32,
+                                    "load_duration": load_ns})
+        if path == "/api/chat":
+            return self._send_json({"model": req.get("model"), "done": True,
+                                    "message": {"role": "assistant", "content": text},
+                                    "eval_count": len(text.split()), "prompt_eval_count": 32,
+                                    "load_duration": load_ns})
+        self._send_json({"error": "not found"}, 404)
+
+
+class GraphHandler(_Handler):
+    """Batch publishing (POST /<version>/, with attached photos), /me/accounts and the OAuth token exchange."""
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        path = urlparse(self.path).path
+        if path.endswith("/oauth/access_token"):
+            return self._send_json({"access_token": "fake-user-token", "token_type": "bearer"})
+        if path.endswith("/me/accounts"):
+            return self._send_json({"data": [
+                {"id": f"page_{i}", "name": f"Fake Page {i}", "access_token": f"page-token-{i}"}
+                for i in range(3)
+            ]})
+        self._send_json({"error": {"message": "unknown path", "code": 803}}, 404)
+
+    def _read_form(self) -> tuple[dict, dict]:
+        """(fields, files) from a urlencoded or multipart body; values are lists like parse_qs."""
+        body = self._read_body()
+        ctype = self.headers.get("Content-Type", "")
+        if not ctype.startswith("multipart/"):
+            return parse_qs(body.decode()), {}
+        msg = BytesParser().parsebytes(f"Content-Type: {ctype}\r\n\r\n".encode() + body)
+        fields, files = {}, {}
+        for part in msg.get_payload():
+            name = part.get_param("name", header="content-disposition")
+            if part.get_filename():
+                files[name] = part.get_payload(decode=True)
+            else:
+                fields.setdefault(name, []).append(part.get_payload(decode=True).decode())
+        return fields, files
+
+    def do_POST(self):
+        form, files = self._read_form()
+        time.sleep(self.latency)
+        if "batch" not in form:
+            return self._send_json({"id": f"post_{time.time_ns()}"})
+        batch = json.loads(form["batch"][0])
+        missing = [op["attached_files"] for op in batch if op.get("attached_files") not in (None, *files)]
+        if missing:
+            return self._send_json({"error": {"message": f"missing attached files {missing}", "code": 100}}, 400)
+        self._send_json([
+            {"code": 200, "body": json.dumps({"id": f"{op['relative_url'].split('/')[0]}_{time.time_ns()}"})}
+            for op in batch
+        ])
+
+
+def _serve(handler, port: int, latency_ms: float, **attrs) -> ThreadingHTTPServer:
+    cls = type(handler.__name__, (handler,), {"latency": latency_ms / 1000, **attrs})
+    server = ThreadingHTTPServer(("127.0.0.1", port), cls)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_ollama(port: int = 0, latency_ms: float = 0, swap_ms: float = 0,
+                 max_loaded: int = 1) -> ThreadingHTTPServer:
+    """Start the fake Ollama server; port 0 picks a free port (see server.server_port)."""
+    return _serve(OllamaHandler, port, latency_ms, swap_latency=swap_ms / 1000,
+                  max_loaded=max_loaded, resident=[], resident_lock=threading.Lock())
+
+
+def start_graph(port: int = 0, latency_ms: float = 0) -> ThreadingHTTPServer:
+    """Start the fake Graph server; point FB_API_URL at http://127.0.0.1:<port>/v24.0."""
+    return _serve(GraphHandler, port, latency_ms)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--ollama-port", type=int, default=11500)
+    parser.add_argument("--graph-port", type=int, default=11600)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--swap-ms", type=float, default=0, help="fake Ollama model load time")
+    args = parser.parse_args()
+    start_ollama(args.ollama_port, args.latency_ms, args.swap_ms)
+    start_graph(args.graph_port, args.latency_ms)
+    print(f"fake Ollama on :{args.ollama_port}, fake Graph on :{args.graph_port}/v24.0 "
+          f"({args.latency_ms:g} ms latency). Ctrl-C to stop.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,276 @@
+"""
+Benchmark harness: seeds a database, starts the fake Ollama / Graph servers
+and measures the scheduler tasks and HTTP endpoints.
+
+    python -m bench.run --clients 10000 --posts 1000000 --llm-latency-ms 300
+
+For every scenario it records wall time and SQL statement count/time. For
+endpoint scenarios it also records p50/p95/p99 latency and throughput. Results
+are printed and written as JSON (default bench/results/<timestamp>.json) so
+runs can be diffed over time.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from bench.fake_servers import start_graph, start_ollama
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+# ------------------------------
+# Measurement helpers
+# ------------------------------
+class QueryCounter:
+    """
+    Counts statements and DB time on one or more engines via cursor events.
+    Pass an AsyncEngine's .sync_engine to include the async routes.
+    """
+
+    def __init__(self, *engines):
+        from sqlalchemy import event
+
+        self.statements = 0
+        self.seconds = 0.0
+        self._started = {}
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", self._before)
+            event.listen(engine, "after_cursor_execute", self._after)
+
+    def _before(self, conn, cursor, statement, params, context, executemany):
+        self._started[id(cursor)] = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, params, context, executemany):
+        self.statements += 1
+        self.seconds += time.perf_counter() - self._started.pop(id(cursor), time.perf_counter())
+
+    @contextmanager
+    def measure(self, out: dict):
+        s0, t0, w0 = self.statements, self.seconds, time.perf_counter()
+        yield
+        out["wall_s"] = round(time.perf_counter() - w0, 4)
+        out["queries"] = self.statements - s0
+        out["db_s"] = round(self.seconds - t0, 4)
+
+
+def percentiles(samples: list[float]) -> dict:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(pct(50) * 1000, 3),
+        "p95_ms": round(pct(95) * 1000, 3),
+        "p99_ms": round(pct(99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def hit_endpoint(counter, send, requests: int) -> dict:
+    """Call send(i) `requests` times; latency percentiles, throughput and queries/request."""
+    out, samples, errors = {}, [], 0
+    with counter.measure(out):
+        for i in range(requests):
+            t = time.perf_counter()
+            r = send(i)
+            samples.append(time.perf_counter() - t)
+            errors += r.status_code >= 400
+    out.update(percentiles(samples))
+    out["errors"] = errors
+    out["throughput_rps"] = round(requests / out["wall_s"], 2) if out["wall_s"] else None
+    out["queries_per_request"] = round(out["queries"] / requests, 2) if requests else None
+    return out
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+# ------------------------------
+# Scenarios
+# ------------------------------
+def bench_scheduler(counter, db_factory, due_ratio: float) -> dict:
+    from sqlalchemy import update
+    from backend.models import Client, WeeklyUsage
+    from worker.tasks.publish import ai_daily_scheduler
+
+    # make a share of clients due right now, with quota available
+    with db_factory() as db:
+        now = datetime.utcnow()
+        ids = [cid for (cid,) in db.query(Client.id)]
+        due = random.sample(ids, int(len(ids) * due_ratio))
+        db.execute(update(Client).values(next_post_at=now + timedelta(days=1), lease_owner=None, lease_until=None))
+        if due:
+            db.execute(update(Client).where(Client.id.in_(due)).values(next_post_at=now - timedelta(minutes=1)))
+        db.execute(update(WeeklyUsage).values(posts_made=0))
+        db.commit()
+
+    out = {"clients_total": len(ids), "clients_due": len(due)}
+    with counter.measure(out):
+        # one shard: the bench runs in a single process
+        out["result"] = ai_daily_scheduler(shards=1)
+    out["clients_per_s"] = round(len(due) / out["wall_s"], 2) if out["wall_s"] else None
+    return out
+
+
+def bench_schedule_next_post(counter) -> dict:
+    from worker.tasks.posting import schedule_next_post
+
+    out = {}
+    with counter.measure(out):
+        out["result"] = schedule_next_post(shards=1)
+    return out
+
+
+def bench_publisher(counter) -> dict:
+    from worker.tasks.publish import post_scheduled_posts
+
+    out = {}
+    with counter.measure(out):
+        out["result"] = post_scheduled_posts()
+    posted = (out["result"] or {}).get("posted", 0)
+    out["posts_per_s"] = round(posted / out["wall_s"], 2) if out["wall_s"] else None
+    return out
+
+
+def bench_endpoints(counter, client_ids: list[int], requests: int, page_size: int) -> dict:
+    from fastapi.testclient import TestClient
+    from backend.main import app
+
+    rng = random.Random(7)
+    results = {}
+    with TestClient(app) as http:
+        results["GET /posts/{client_id}"] = hit_endpoint(
+            counter, lambda i: http.get(f"/posts/{rng.choice(client_ids)}", params={"limit": page_size}), requests)
+
+        # walk one client's full history with the cursor
+        busiest = client_ids[0]
+        cursor, pages = None, 0
+
+        def next_page(i):
+            nonlocal cursor, pages
+            r = http.get(f"/posts/{busiest}", params={"limit": page_size, **({"cursor": cursor} if cursor else {})})
+            cursor = r.json().get("next_cursor")
+            pages += 1
+            return r
+        walk = {}
+        with counter.measure(walk):
+            next_page(0)
+            while cursor:
+                next_page(0)
+        walk["pages"] = pages
+        results["GET /posts/{client_id} full scroll"] = walk
+
+        # varied payloads so the generation cache does not answer everything
+        results["POST /generate/caption"] = hit_endpoint(counter, lambda i: http.post(
+            "/generate/caption", json={"businessName": f"Salon {i}", "city": "Azusa", "vibe": "calm",
+                                       "services": "gel"}), requests)
+        results["POST /generate/caption (cached)"] = hit_endpoint(counter, lambda i: http.post(
+            "/generate/caption", json={"businessName": "Salon 0", "city": "Azusa", "vibe": "calm",
+                                       "services": "gel"}), requests)
+        results["POST /generate/hashtags"] = hit_endpoint(counter, lambda i: http.post(
+            "/generate/hashtags", json={"city": f"City {i}", "services": "nails"}), requests)
+        results["POST /ai/generate-once"] = hit_endpoint(counter, lambda i: http.post(
+            "/ai/generate-once", json={"client_id": rng.choice(client_ids), "brief": f"promo {i}"}), requests)
+    return results
+
+
+# ------------------------------
+# Main
+# ------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the WillDev benchmark suite.")
+    parser.add_argument("--db", default="./bench.db", help="SQLite file (ignored if DATABASE_URL is set)")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--posts", type=int, default=100_000)
+    parser.add_argument("--plans", type=int, default=3)
+    parser.add_argument("--no-seed", action="store_true", help="reuse the existing database")
+    parser.add_argument("--due-ratio", type=float, default=0.1, help="share of clients due in the scheduler pass")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint scenario")
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--llm-latency-ms", type=float, default=50)
+    parser.add_argument("--graph-latency-ms", type=float, default=50)
+    parser.add_argument("--swap-ms", type=float, default=0, help="fake Ollama model load (swap) time")
+    parser.add_argument("--only", nargs="*", choices=["scheduler", "schedule_next_post", "publisher", "endpoints"])
+    parser.add_argument("--out", help="JSON output path (default bench/results/<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    ollama = start_ollama(0, args.llm_latency_ms, args.swap_ms)
+    graph = start_graph(0, args.graph_latency_ms)
+
+    # configure the app before any backend module reads its env
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.abspath(args.db)}")
+    os.environ["OLLAMA_URL"] = f"http://127.0.0.1:{ollama.server_port}"
+    os.environ["FB_API_URL"] = f"http://127.0.0.1:{graph.server_port}/v24.0"
+    os.environ.setdefault("GRAPH_PAGE_BURST", "1000")
+
+    from sqlalchemy import func
+    from backend.database import engine, async_engine, SessionLocal
+    from backend.models import Client, Post
+    from bench.seed import seed
+
+    report = {
+        "meta": {
+            "started_at": datetime.utcnow().isoformat() + "Z",
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "database": engine.url.render_as_string(hide_password=True),
+            "args": vars(args),
+        },
+        "results": {},
+    }
+
+    if not args.no_seed:
+        print(f"seeding {args.clients} clients / {args.posts} posts ...", flush=True)
+        report["results"]["seed"] = seed(engine, clients=args.clients, posts=args.posts, plans=args.plans)
+
+    with SessionLocal() as db:
+        # busiest clients first, so the scroll scenario walks a long history
+        client_ids = [cid for cid, _ in (db.query(Post.client_id, func.count())
+                                           .group_by(Post.client_id)
+                                           .order_by(func.count().desc())
+                                           .all())] or [cid for (cid,) in db.query(Client.id)]
+
+    # async_engine: the /ai and /generate routes use AsyncSession
+    counter = QueryCounter(engine, async_engine.sync_engine)
+    wanted = set(args.only or ["scheduler", "schedule_next_post", "publisher", "endpoints"])
+    scenarios = [
+        ("ai_daily_scheduler", "scheduler", lambda: bench_scheduler(counter, SessionLocal, args.due_ratio)),
+        ("schedule_next_post", "schedule_next_post", lambda: bench_schedule_next_post(counter)),
+        ("post_scheduled_posts", "publisher", lambda: bench_publisher(counter)),
+        ("endpoints", "endpoints", lambda: bench_endpoints(counter, client_ids, args.requests, args.page_size)),
+    ]
+    for name, key, run in scenarios:
+        if key not in wanted:
+            continue
+        print(f"running {name} ...", flush=True)
+        report["results"][name] = run()
+
+    out = Path(args.out) if args.out else RESULTS_DIR / f"{datetime.utcnow():%Y%m%dT%H%M%SZ}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2, default=str))
+    print(json.dumps(report["results"], indent=2, default=str))
+    print(f"results written to {out}")
+    return report
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
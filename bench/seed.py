@@ -0,0 +1,116 @@
+"""
+Seed a database with synthetic clients, posts, plans and usage rows.
+
+    DATABASE_URL=sqlite:///./bench.db python -m bench.seed --clients 10000 --posts 1000000
+
+Rows are written with chunked executemany inserts. The schema is brought up
+to date with backend.migrations first.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, delete, select
+
+CITIES = ["Azusa", "Pasadena", "Glendora", "Covina", "Monrovia", "Arcadia", "West Covina", "Duarte"]
+INDUSTRIES = ["nails", "hair", "lashes", "brows", "spa", "barber"]
+TIMEZONES = ["America/Los_Angeles", "America/Denver", "America/Chicago", "America/New_York"]
+MODELS = ["llama3", "llama3", "llama3", "mistral", "phi3"]
+STATUSES = ["draft"] * 2 + ["scheduled"] + ["posted"] * 6 + ["failed"]
+
+
+def _chunks(rows, size):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def seed(engine, clients: int = 1000, posts: int = 100_000, plans: int = 3,
+         subscribed_ratio: float = 0.5, seed_value: int = 42, chunk: int = 10_000,
+         reset: bool = True) -> dict:
+    """Insert the synthetic data set; returns row counts and elapsed seconds."""
+    from backend.migrations import upgrade
+    from backend.models import Client, Post, SubscriptionPlan, ClientSubscription, WeeklyUsage
+    from backend.services.quota import week_start_today
+
+    rng = random.Random(seed_value)
+    started = time.perf_counter()
+    upgrade(engine)
+    now = datetime.utcnow()
+
+    with engine.begin() as conn:
+        if reset:
+            for model in (WeeklyUsage, ClientSubscription, Post, Client, SubscriptionPlan):
+                conn.execute(delete(model))
+
+        conn.execute(insert(SubscriptionPlan), [{"name": "free", "weekly_post_limit": 3}] + [
+            {"name": f"plan_{i}", "weekly_post_limit": 3 + 4 * i} for i in range(1, plans)
+        ])
+        plan_ids = list(conn.execute(select(SubscriptionPlan.id)).scalars())
+
+        client_rows = []
+        for i in range(clients):
+            client_rows.append({
+                "name": f"Bench Salon {i}",
+                "city": rng.choice(CITIES),
+                "industry": rng.choice(INDUSTRIES),
+                "facebook_page_id": f"page_{i}",
+                "facebook_page_token": f"page-token-{i}",
+                "preferences_json": {"categories": rng.sample(["gel", "acrylic", "pedicure", "art", "promo"], 2),
+                                     "ai_auto": True},
+                "model_name": rng.choice(MODELS),
+                "timezone": rng.choice(TIMEZONES),
+                "post_time_hour": rng.randint(8, 20),
+                "post_time_minute": rng.choice([0, 15, 30, 45]),
+                # spread due times over the next day
+                "next_post_at": now + timedelta(minutes=rng.randint(-60, 24 * 60)),
+            })
+        for part in _chunks(client_rows, chunk):
+            conn.execute(insert(Client), part)
+        client_ids = list(conn.execute(select(Client.id)).scalars())
+
+        subs = [{"client_id": cid, "plan_id": rng.choice(plan_ids)}
+                for cid in client_ids if rng.random() < subscribed_ratio]
+        for part in _chunks(subs, chunk):
+            conn.execute(insert(ClientSubscription), part)
+
+        ws = week_start_today()
+        usage = [{"client_id": cid, "week_start": ws, "posts_made": rng.randint(0, 3)} for cid in client_ids]
+        for part in _chunks(usage, chunk):
+            conn.execute(insert(WeeklyUsage), part)
+
+        written = 0
+        while written < posts:
+            batch = []
+            for _ in range(min(chunk, posts - written)):
+                status = rng.choice(STATUSES)
+                created = now - timedelta(minutes=rng.randint(0, 365 * 24 * 60))
+                scheduled = created + timedelta(hours=rng.randint(1, 72)) if status != "draft" else None
+                batch.append({
+                    "client_id": rng.choice(client_ids),
+                    "caption": f"Synthetic caption {written + len(batch)} — fresh sets all week ✨",
+                    "hashtags": "#NailInspo #SelfCare #Bench",
+                    "status": status,
+                    "created_at": created,
+                    "scheduled_at": scheduled,
+                    "posted_at": scheduled if status == "posted" else None,
+                })
+            conn.execute(insert(Post), batch)
+            written += len(batch)
+
+    return {
+        "clients": clients, "posts": posts, "plans": plans, "subscriptions": len(subs),
+        "usage_rows": len(usage), "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed a benchmark database ($DATABASE_URL).")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--posts", type=int, default=100_000)
+    parser.add_argument("--plans", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    from backend.database import engine
+    print(seed(engine, clients=args.clients, posts=args.posts, plans=args.plans, seed_value=args.seed))
@@ -1,6 +1,11 @@
 from celery import Celery
+from celery.signals import (
+    worker_init, worker_ready, worker_process_init, worker_process_shutdown, task_prerun, task_postrun,
+)
 import os
 import sys
+import threading
+import time
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 
@@ -14,6 +19,8 @@ celery = Celery(
         "worker.tasks.posting",
         "worker.tasks.generate",
         "worker.tasks.publish",
+        "worker.tasks.hashtags",
+        "worker.tasks.archive",
     ],
 )
 
@@ -29,10 +36,104 @@ celery.conf.beat_schedule = {
     },
     
 }
-from celery.schedules import crontab
+# Safety-net sweep over the due-time index (Client.next_post_at). Each pass
+# only loads clients that are due, and enqueues an ETA run for each due
+# time before the following sweep, so posts go out on time.
 celery.conf.beat_schedule.update({
-    "ai-daily-scheduler-5min": {
-        "task": "worker.tasks.schedule.ai_daily_scheduler",
-        "schedule": 60 * 5,
+    "ai-daily-scheduler-sweep": {
+        "task": "worker.tasks.publish.ai_daily_scheduler",
+        "schedule": int(os.getenv("SCHEDULER_SWEEP_SECONDS", "60")),
+    },
+    # Hashtag bank: only missing / expired (city, industry) pairs are regenerated
+    "refresh-hashtag-bank": {
+        "task": "worker.tasks.hashtags.refresh_hashtag_bank",
+        "schedule": int(os.getenv("HASHTAG_REFRESH_SECONDS", str(60 * 60))),
+    },
+    # Cold tier: old posted / failed posts move out of the posts table
+    "archive-old-posts": {
+        "task": "worker.tasks.archive.archive_old_posts",
+        "schedule": int(os.getenv("ARCHIVE_EVERY_SECONDS", str(24 * 60 * 60))),
     },
-})
\ No newline at end of file
+})
+
+
+# Long-lived event loop (and the Ollama / Graph connection pools on it) per worker process
+@worker_process_init.connect
+def start_async_pools(**kwargs):
+    from backend.services import aio
+    aio.start_background_loop()
+
+@worker_process_shutdown.connect
+def stop_async_pools(**kwargs):
+    from backend.services import aio
+    aio.stop_background_loop()
+
+# Everything a worker sends to Ollama queues behind interactive API calls
+# (set in the main process, inherited by prefork children)
+@worker_init.connect
+def use_batch_lane(**kwargs):
+    from backend.services import admission
+    admission.set_default_lane("batch")
+
+# Load the most-used Ollama models once per worker, off the startup path
+# (a cold load can take tens of seconds)
+@worker_ready.connect
+def preload_models(**kwargs):
+    from backend.services.llm import preload_popular_models
+    threading.Thread(target=preload_popular_models, name="ollama-preload", daemon=True).start()
+
+
+# ------------------------------
+# Metrics: task duration / outcome, exported by the worker (see metrics.py)
+# ------------------------------
+_task_started = {}
+
+@worker_init.connect
+def start_metrics_exporter(**kwargs):
+    from backend.services import metrics
+    metrics.start_worker_exporter()
+
+# Prefork children record the task metrics; without PROMETHEUS_MULTIPROC_DIR
+# each one exposes them on its own port
+@worker_process_init.connect
+def start_child_metrics_exporter(**kwargs):
+    from celery.utils.log import current_process_index
+    from backend.services import metrics
+    metrics.start_child_exporter(current_process_index())
+
+@worker_process_shutdown.connect
+def drop_process_metrics(pid=None, **kwargs):
+    from backend.services import metrics
+    metrics.mark_process_dead(pid or os.getpid())
+
+@task_prerun.connect
+def task_started(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+@task_postrun.connect
+def task_finished(task_id=None, task=None, state=None, **kwargs):
+    from backend.services.metrics import TASK_DURATION, TASK_OUTCOMES
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        TASK_DURATION.labels(task=task.name).observe(time.perf_counter() - started)
+    TASK_OUTCOMES.labels(task=task.name, state=(state or "unknown").lower()).inc()
+
+
+# ------------------------------
+# SQL profiling per task (SQL_PROFILE=1)
+# ------------------------------
+_task_profiles = {}
+
+@task_prerun.connect
+def start_sql_profile(task_id=None, task=None, **kwargs):
+    from backend.services import sqlprofile
+    if sqlprofile.SQL_PROFILE:
+        ctx = sqlprofile.profile(task.name)
+        ctx.__enter__()
+        _task_profiles[task_id] = ctx
+
+@task_postrun.connect
+def finish_sql_profile(task_id=None, **kwargs):
+    ctx = _task_profiles.pop(task_id, None)
+    if ctx is not None:
+        ctx.__exit__(None, None, None)
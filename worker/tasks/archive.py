@@ -0,0 +1,73 @@
+import os
+from datetime import datetime, timedelta
+from celery import shared_task
+from sqlalchemy import delete
+from backend.database import SessionLocal
+from backend.models import Post
+from backend.services.archive import (
+    ARCHIVE_AFTER_DAYS, ARCHIVE_STATUSES, COLUMNS, append_rows, archive_lock, month_key,
+)
+
+# Posts moved per round (one DELETE each), and rounds per task run
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "5000"))
+ARCHIVE_MAX_ROUNDS = int(os.getenv("ARCHIVE_MAX_ROUNDS", "100"))
+
+
+@shared_task
+def archive_old_posts(days: int = None):
+    """
+    Move posted / failed posts created more than `days` (ARCHIVE_AFTER_DAYS)
+    ago out of the posts table into per-client, per-month partition files
+    (see services/archive.py). Each round writes its partitions before
+    deleting the rows, so a crash in between leaves a row in both tiers,
+    never in neither; the listing prefers the hot copy. Runs hold
+    archive_lock, so two never rewrite the same partition at once; a run
+    that finds it taken skips.
+    """
+    with archive_lock(blocking=False) as locked:
+        if not locked:
+            print("⚠️ Archive run skipped: another run holds the archive lock")
+            return {"archived": 0, "partitions": 0, "skipped": True}
+        return _archive_old_posts(days)
+
+
+def _archive_old_posts(days: int = None) -> dict:
+    cutoff = datetime.utcnow() - timedelta(days=ARCHIVE_AFTER_DAYS if days is None else days)
+    columns = [getattr(Post, c) for c in COLUMNS]
+    db = SessionLocal()
+    stats = {"archived": 0, "partitions": 0}
+    try:
+        for _ in range(ARCHIVE_MAX_ROUNDS):
+            rows = (db.query(*columns)
+                      .filter(Post.status.in_(ARCHIVE_STATUSES), Post.created_at < cutoff)
+                      .order_by(Post.client_id, Post.created_at)
+                      .limit(ARCHIVE_BATCH_SIZE)
+                      .all())
+            if not rows:
+                break
+
+            partitions = {}
+            for row in rows:
+                row = dict(zip(COLUMNS, row))
+                partitions.setdefault((row["client_id"], month_key(row["created_at"])), []).append(row)
+            for (client_id, month), part in partitions.items():
+                append_rows(client_id, month, part)
+
+            db.execute(
+                delete(Post)
+                .where(Post.id.in_([r.id for r in rows]))
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            stats["archived"] += len(rows)
+            stats["partitions"] += len(partitions)
+
+        if stats["archived"]:
+            print(f"[OK] Archived {stats['archived']} posts older than {cutoff:%Y-%m-%d} "
+                  f"into {stats['partitions']} partition writes")
+        return stats
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
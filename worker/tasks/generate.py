@@ -2,39 +2,141 @@ import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 
 from datetime import datetime, timedelta
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
-from backend.models import Post, Client
-from backend.database import DATABASE_URL
+from celery import group
+from sqlalchemy import select, insert
+from backend.models import Post, Client, CLIENT_SCHEDULE_COLUMNS
+from backend.database import SessionLocal
+from backend.services import aio
+from backend.services.ai import generate_caption_variants_async
+from backend.services.cache import hash_text
+from backend.services.llm import gateway, DEFAULT_MODEL
 from worker.celery_app import celery
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(bind=engine)
+# Drafts per client per month, and how many variants one completion asks for
+MONTHLY_POSTS = int(os.getenv("MONTHLY_POSTS", "20"))
+MONTHLY_POSTS_MAX = 30
+VARIANTS_PER_CALL = int(os.getenv("MONTHLY_VARIANTS_PER_CALL", "8"))
+# Follow-up calls allowed beyond the minimum needed, to fill dupes / short replies
+EXTRA_CALLS = int(os.getenv("MONTHLY_EXTRA_CALLS", "3"))
+# How many of the client's latest captions new drafts are checked against
+DEDUPE_DEPTH = int(os.getenv("MONTHLY_DEDUPE_DEPTH", "1000"))
+MONTHLY_GEN_TIMEOUT = float(os.getenv("MONTHLY_GEN_TIMEOUT", "120"))
+
+FALLBACK_BRIEF = "A month of short nail-salon promotional posts."
+
+
+async def generate_month(count: int, categories, city, model, seen: set[str]) -> tuple[list[dict], int, int]:
+    """
+    Ask for VARIANTS_PER_CALL posts per completion until `count` new ones
+    are collected (or the call budget runs out). Returns (posts, calls, dupes).
+    `seen` holds hash_text() digests of captions to skip; it is updated.
+    """
+    posts, calls, dupes = [], 0, 0
+    max_calls = -(-count // VARIANTS_PER_CALL) + EXTRA_CALLS
+    while len(posts) < count and calls < max_calls:
+        need = min(VARIANTS_PER_CALL, count - len(posts))
+        # follow-ups are told what they already wrote
+        avoid = [p["caption"] for p in posts[-5:]]
+        calls += 1
+        try:
+            variants = await generate_caption_variants_async(
+                need, FALLBACK_BRIEF, categories, city, model=model, avoid=avoid,
+                timeout=MONTHLY_GEN_TIMEOUT,
+            )
+        except Exception as e:
+            print(f"⚠️ Variant generation failed: {e!r}")
+            continue
+        for v in variants:
+            digest = hash_text(v["caption"])
+            if digest in seen:
+                dupes += 1
+                continue
+            seen.add(digest)
+            posts.append(v)
+    return posts[:count], calls, dupes
+
 
 @celery.task
-def generate_monthly_posts(client_id: int):
+def generate_monthly_posts(client_id: int, count: int = None):
     """
-    Example placeholder task — generates one sample draft post.
-    Later we integrate your real AI generate logic.
+    Generate a month of drafts for one client: multi-variant completions
+    (one prompt yields several posts), deduplicated against the client's
+    existing captions, written with a single bulk insert.
     """
+    count = max(1, min(count or MONTHLY_POSTS, MONTHLY_POSTS_MAX))
     db = SessionLocal()
+    try:
+        client = db.query(*CLIENT_SCHEDULE_COLUMNS).filter(Client.id == client_id).first()
+        if not client:
+            return {"client_id": client_id, "created": 0}
+        categories = (client.preferences_json or {}).get("categories", [])
+        city, model = client.city, client.model_name
+
+        existing = db.execute(
+            select(Post.caption)
+            .where(Post.client_id == client_id)
+            .order_by(Post.created_at.desc())
+            .limit(DEDUPE_DEPTH)
+        ).scalars()
+        seen = {hash_text(c) for c in existing if c}
+        # end the read transaction before the LLM calls
+        db.commit()
+
+        posts, calls, dupes = aio.run_sync(generate_month(count, categories, city, model, seen))
+
+        # drafts keep their generated order for load_oldest_drafts()
+        now = datetime.utcnow()
+        rows = [
+            {
+                "client_id": client_id,
+                "caption": p["caption"],
+                "hashtags": p["hashtags"],
+                "status": "draft",
+                "created_at": now + timedelta(microseconds=i),
+            }
+            for i, p in enumerate(posts)
+        ]
+        if rows:
+            db.execute(insert(Post), rows)
+            db.commit()
 
-    client = db.query(Client).filter(Client.id == client_id).first()
-    if not client:
+        print(f"[OK] Generated {len(rows)}/{count} drafts for client {client_id} "
+              f"({calls} calls, {dupes} duplicates dropped)")
+        return {"client_id": client_id, "created": len(rows), "calls": calls, "duplicates": dupes}
+    except Exception:
+        db.rollback()
+        raise
+    finally:
         db.close()
-        return
-
-    sample_caption = f"New style day at {client.name} in {client.city} ✨"
-    new_post = Post(
-        client_id=client_id,
-        caption=sample_caption,
-        hashtags="#nails #nailart #selfcare",
-        status="draft",
-        created_at=datetime.utcnow()
-    )
-
-    db.add(new_post)
-    db.commit()
-    db.close()
-
-    print(f"[OK] Generated sample post for client {client_id}")
\ No newline at end of file
+
+
+@celery.task
+def generate_monthly_posts_for_clients(client_ids: list[int] = None, count: int = None):
+    """
+    Fan generate_monthly_posts out as one task per client (a Celery group),
+    so the month's drafts are generated in parallel across workers.
+    Without `client_ids`, every client with ai_auto enabled. Tasks are
+    queued grouped by model so workers don't alternate between models.
+    """
+    db = SessionLocal()
+    try:
+        q = db.query(Client.id, Client.model_name, Client.preferences_json)
+        if client_ids is not None:
+            q = q.filter(Client.id.in_(client_ids))
+        rows = q.all()
+    finally:
+        db.close()
+    if client_ids is None:
+        rows = [r for r in rows if (r.preferences_json or {}).get("ai_auto")]
+    if not rows:
+        return {"clients": 0}
+
+    by_model = {}
+    for cid, model, _ in rows:
+        by_model.setdefault(model or DEFAULT_MODEL, []).append(cid)
+    order = aio.run_sync(gateway.affinity_order({m: len(ids) for m, ids in by_model.items()}))
+    client_ids = [cid for model in order for cid in by_model[model]]
+
+    group(generate_monthly_posts.s(cid, count) for cid in client_ids).apply_async()
+    print(f"[OK] Queued monthly generation for {len(client_ids)} clients")
+    return {"clients": len(client_ids)}
@@ -0,0 +1,47 @@
+from datetime import datetime
+from celery import shared_task
+from backend.database import SessionLocal
+from backend.models import HashtagSet
+from backend.services import aio
+from backend.services.hashtags import combos_to_refresh, generate_sets, hashtag_bank
+from backend.services.llm import DEFAULT_MODEL
+
+
+@shared_task
+def refresh_hashtag_bank():
+    """
+    (Re)generate ranked hashtag sets for every (city, industry) pair in
+    `clients` that is missing from the bank or older than HASHTAG_BANK_TTL,
+    up to HASHTAG_REFRESH_BATCH pairs per run.
+    """
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        pairs = combos_to_refresh(db, now)
+        if not pairs:
+            return {"refreshed": 0}
+        # end the read transaction before the LLM calls
+        db.commit()
+
+        sets = aio.run_sync(generate_sets(pairs))
+
+        existing = {
+            (row.city, row.industry): row
+            for row in db.query(HashtagSet).filter(HashtagSet.city.in_({c for c, _ in sets}))
+        }
+        for (city, industry), tags in sets.items():
+            row = existing.get((city, industry))
+            if row is None:
+                db.add(HashtagSet(city=city, industry=industry, hashtags=tags,
+                                  model=DEFAULT_MODEL, refreshed_at=now))
+            else:
+                row.hashtags, row.model, row.refreshed_at = tags, DEFAULT_MODEL, now
+            hashtag_bank.put(city, industry, tags)
+        db.commit()
+        print(f"[OK] Hashtag bank: refreshed {len(sets)}/{len(pairs)} city/industry pairs")
+        return {"refreshed": len(sets), "pending": len(pairs) - len(sets)}
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
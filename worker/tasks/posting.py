@@ -1,16 +1,17 @@
-
 import sys, os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 
 from datetime import datetime, timedelta
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from celery import chord, group
+from sqlalchemy import func, update
 from backend.models import Post, Client
-from backend.database import DATABASE_URL
+from backend.database import SessionLocal
+from backend.services.quota import week_start_today, reserve_slots, release_slots
+from backend.services.schedule import shard_count, in_shard
 from worker.celery_app import celery
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(bind=engine)
+# Draft ids moved to "scheduled" per UPDATE
+SCHEDULE_CHUNK = int(os.getenv("SCHEDULE_NEXT_POST_CHUNK", "500"))
 
 def choose_post_time(city: str) -> int:
     """
@@ -19,37 +20,113 @@ def choose_post_time(city: str) -> int:
     """
     return 11  # 11:00 AM local — universal salon engagement sweet spot
 
+def next_post_slot(city: str, now: datetime) -> datetime:
+    """Today's slot for the city, or tomorrow's if it has already passed."""
+    post_hour = choose_post_time(city)
+    scheduled = datetime(now.year, now.month, now.day, post_hour)
+    if scheduled < now:
+        scheduled += timedelta(days=1)
+    return scheduled
+
 @celery.task
-def schedule_next_post():
+def schedule_next_post(shards: int = None):
+    """
+    Schedule the oldest draft of every client that has one and weekly
+    quota left (drafts beyond the quota wait for next week). Clients are
+    split into id shards run as a Celery group (one schedule_next_post_shard
+    task each), with a chord reporting the totals; small runs are handled
+    inline as a single shard.
+    """
     db = SessionLocal()
+    try:
+        clients = (db.query(func.count(func.distinct(Post.client_id)))
+                     .filter(Post.status == "draft")
+                     .scalar())
+    finally:
+        db.close()
 
-    # Get all clients with unscheduled draft posts
-    clients = db.query(Client).all()
+    shards = shards or shard_count(clients)
+    if shards == 1:
+        return run_schedule_next_post_shard(0, 1)
 
-    for client in clients:
-        # Find next unscheduled post
-        post = (
-            db.query(Post)
-            .filter(Post.client_id == client.id, Post.status == "draft")
-            .order_by(Post.created_at.asc())
-            .first()
-        )
+    chord(group(schedule_next_post_shard.s(k, shards) for k in range(shards)))(schedule_next_post_report.s())
+    print(f"[OK] Scheduling next posts for {clients} clients in {shards} shards")
+    return {"clients": clients, "shards": shards}
 
-        if not post:
-            continue  # nothing to schedule
+@celery.task
+def schedule_next_post_shard(shard: int, shards: int):
+    """One shard of schedule_next_post. Errors are reported, not raised, so the chord still completes."""
+    try:
+        return run_schedule_next_post_shard(shard, shards)
+    except Exception as e:
+        print(f"❌ schedule_next_post shard {shard}/{shards} failed: {e!r}")
+        return {"shard": shard, "clients": 0, "scheduled": 0, "quota_skipped": 0, "error": repr(e)}
 
-        # Determine optimal time
-        post_hour = choose_post_time(client.city)
-        today = datetime.now().date()
-        scheduled = datetime(today.year, today.month, today.day, post_hour)
+def run_schedule_next_post_shard(shard: int, shards: int) -> dict:
+    """
+    The oldest draft per client in one query, then per chunk: a weekly
+    quota reservation (quota.reserve_slots), so drafts go out no faster than
+    the client's plan allows, and one UPDATE of the reserved clients'
+    drafts. The UPDATE only moves rows still in "draft", so a post claimed
+    by an overlapping run is never scheduled twice (its slot is handed
+    back).
+    """
+    db = SessionLocal()
+    try:
+        rn = func.row_number().over(
+            partition_by=Post.client_id,
+            order_by=(Post.created_at.asc(), Post.id.asc()),
+        ).label("rn")
+        ranked = (db.query(Post.client_id, Post.id, rn)
+                    .filter(Post.status == "draft", in_shard(Post.client_id, shard, shards))
+                    .subquery())
+        rows = (db.query(ranked.c.id, ranked.c.client_id, Client.city)
+                  .join(Client, Client.id == ranked.c.client_id)
+                  .filter(ranked.c.rn == 1)
+                  .all())
 
-        # If it's already past this time today → schedule tomorrow
-        if scheduled < datetime.now():
-            scheduled += timedelta(days=1)
+        # Determine optimal time, per city
+        now = datetime.now()
+        by_slot = {}
+        for pid, cid, city in rows:
+            by_slot.setdefault(next_post_slot(city, now), []).append((pid, cid))
 
-        post.scheduled_at = scheduled
-        post.status = "scheduled"
-        db.add(post)
+        ws = week_start_today()
+        scheduled = quota_skipped = 0
+        for at, drafts in by_slot.items():
+            for i in range(0, len(drafts), SCHEDULE_CHUNK):
+                chunk = drafts[i:i + SCHEDULE_CHUNK]
+                reserved = reserve_slots(db, [cid for _, cid in chunk], ws)
+                quota_skipped += len(chunk) - len(reserved)
+                if not reserved:
+                    continue
+                moved = {cid for (cid,) in db.execute(
+                    update(Post)
+                    .where(Post.id.in_([pid for pid, cid in chunk if cid in reserved]),
+                           Post.status == "draft")
+                    .values(status="scheduled", scheduled_at=at)
+                    .returning(Post.client_id)
+                    .execution_options(synchronize_session=False)
+                )}
+                release_slots(db, reserved - moved, ws)
+                scheduled += len(moved)
+        db.commit()
+        return {"shard": shard, "clients": len(rows), "scheduled": scheduled, "quota_skipped": quota_skipped}
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
 
-    db.commit()
-    db.close()
\ No newline at end of file
+@celery.task
+def schedule_next_post_report(results):
+    """Chord body: totals over every shard."""
+    report = {
+        "shards": len(results),
+        "clients": sum(r.get("clients", 0) for r in results),
+        "scheduled": sum(r.get("scheduled", 0) for r in results),
+        "quota_skipped": sum(r.get("quota_skipped", 0) for r in results),
+        "failed_shards": [r["shard"] for r in results if r.get("error")],
+    }
+    print(f"[OK] schedule_next_post done: {report}")
+    return report
@@ -1,94 +1,576 @@
 import os
-from datetime import datetime, timedelta, date
+import time
+import uuid
+import asyncio
+from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-from celery import shared_task
-from sqlalchemy import create_engine, func
-from sqlalchemy.orm import sessionmaker
-from backend.database import DATABASE_URL
-from backend.models import Client, Post, SubscriptionPlan, ClientSubscription, WeeklyUsage
+from celery import chord, group, shared_task
+from sqlalchemy import and_, bindparam, func, insert, or_, update
+from backend.database import SessionLocal
+from backend.models import Client, Post, CLIENT_SCHEDULE_COLUMNS
 from backend.services.ai import generate_caption_async
+from backend.services import aio
+from backend.services.cache import caption_index
+from backend.services.hashtags import hashtag_bank
+from backend.services.graph import graph
+from backend.services.images import digest_from_url, publish_path
+from backend.services.llm import gateway, DEFAULT_MODEL
+from backend.services.metrics import observe_scheduler_pass
+from backend.services.quota import (
+    week_start_today, remaining_slots, reserve_slots,
+)
+from backend.services.schedule import (
+    SCHEDULER_SWEEP_SECONDS, SCHEDULER_LEASE_SECONDS, local_today, local_day_bounds,
+    fire_time_after_today, dispatch_at, shard_count, in_shard,
+)
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(bind=engine)
+FALLBACK_CAPTION = "New set just dropped 💥💅"
+FALLBACK_HASHTAGS = "#NailInspo"
 
-def week_start_today():
-    today = date.today()
-    return today - timedelta(days=today.weekday())  # Monday
+# Caption fan-out: how many Ollama calls run at once, and how long each may take
+GEN_CONCURRENCY = int(os.getenv("SCHEDULER_GEN_CONCURRENCY", "4"))
+GEN_TIMEOUT = float(os.getenv("SCHEDULER_GEN_TIMEOUT", "45"))
 
-def get_weekly_limit(db, client_id: int) -> int:
-    sub = db.query(ClientSubscription).filter_by(client_id=client_id).first()
-    if not sub:
-        plan = db.query(SubscriptionPlan).filter_by(name="free").first()
-    else:
-        plan = db.query(SubscriptionPlan).filter_by(id=sub.plan_id).first()
-    return plan.weekly_post_limit if plan else 3
+# Scheduler: clients leased per round, and rounds per shard run
+SCHEDULER_BATCH_SIZE = int(os.getenv("SCHEDULER_BATCH_SIZE", "200"))
+SCHEDULER_MAX_ROUNDS = int(os.getenv("SCHEDULER_MAX_ROUNDS", "50"))
+
+# Publisher: posts claimed per round, and rounds per task run
+PUBLISH_BATCH_SIZE = int(os.getenv("PUBLISH_BATCH_SIZE", "200"))
+PUBLISH_MAX_ROUNDS = int(os.getenv("PUBLISH_MAX_ROUNDS", "50"))
+# A post left in "publishing" longer than this belongs to a run that died,
+# possibly after Graph published it, so it is marked failed (never resent);
+# keep it well above one round (PUBLISH_BATCH_SIZE posts at GRAPH_PAGE_RATE)
+PUBLISH_CLAIM_TIMEOUT = int(os.getenv("PUBLISH_CLAIM_TIMEOUT", "1800"))
+
+# ------------------------------
+# Bulk loaders (one query each, regardless of client count)
+# ------------------------------
+def load_due_clients(db, now_utc: datetime, client_ids=None):
+    """
+    Returns (client, local_date) for every client whose next_post_at has
+    come due. This is an indexed range scan, so its cost follows the number
+    of due clients rather than the total client count. Clients are
+    CLIENT_SCHEDULE_COLUMNS rows, not ORM objects.
+    """
+    q = db.query(*CLIENT_SCHEDULE_COLUMNS).filter(Client.next_post_at <= now_utc.replace(tzinfo=None))
+    if client_ids:
+        q = q.filter(Client.id.in_(list(client_ids)))
+    return [(c, local_today(c, now_utc)) for c in q.all()]
+
+def advance_next_post_at(db, next_times: dict[int, datetime], owner: str):
+    """
+    Move each handled client's due time and release its lease (one
+    executemany by primary key). Only rows still leased to `owner` are
+    touched, so a run whose lease expired can't clear another run's.
+    """
+    if next_times:
+        db.execute(
+            update(Client.__table__)
+            .where(Client.id == bindparam("b_id"), Client.lease_owner == owner)
+            .values(next_post_at=bindparam("b_next"), lease_owner=None, lease_until=None),
+            [{"b_id": cid, "b_next": at} for cid, at in next_times.items()],
+        )
+
+def dispatch_next_due(db, now_utc: datetime):
+    """
+    Enqueue one ETA run per distinct due time before the following sweep,
+    for the clients due at that moment, so each fires on time instead of
+    up to a sweep late. One indexed range scan over next_post_at.
+    """
+    now = now_utc.replace(tzinfo=None)
+    horizon = now + timedelta(seconds=SCHEDULER_SWEEP_SECONDS)
+    upcoming = {}
+    for cid, at in (db.query(Client.id, Client.next_post_at)
+                      .filter(Client.next_post_at > now, Client.next_post_at <= horizon)
+                      .order_by(Client.next_post_at.asc())):
+        upcoming.setdefault(at, []).append(cid)
+    for at, ids in upcoming.items():
+        dispatch_at(ids, at)
+
+def load_clients_with_post_on(db, due) -> set[int]:
+    """
+    Client ids (of `due` [(client, local_date)]) that already have a
+    scheduled/posted post on their local "today". scheduled_at is naive
+    UTC, so each client's day is its local midnight-to-midnight converted
+    to UTC. Uses a scheduled_at range instead of func.date() so the
+    predicate stays sargable.
+    """
+    if not due:
+        return set()
+    bounds = {c.id: local_day_bounds(c, day) for c, day in due}
+    start = min(b[0] for b in bounds.values())
+    end = max(b[1] for b in bounds.values())
+    rows = (db.query(Post.client_id, Post.scheduled_at)
+              .filter(Post.client_id.in_(list(bounds)),
+                      Post.status.in_(["scheduled", "posted"]),
+                      Post.scheduled_at >= start,
+                      Post.scheduled_at < end)
+              .all())
+    return {cid for cid, at in rows if bounds[cid][0] <= at < bounds[cid][1]}
+
+def load_oldest_drafts(db, client_ids) -> dict[int, int]:
+    """Maps client_id -> id of its oldest draft post."""
+    rn = func.row_number().over(
+        partition_by=Post.client_id,
+        order_by=(Post.created_at.asc(), Post.id.asc()),
+    ).label("rn")
+    ranked = (db.query(Post.client_id, Post.id, rn)
+                .filter(Post.client_id.in_(client_ids), Post.status == "draft")
+                .subquery())
+    rows = db.query(ranked.c.client_id, ranked.c.id).filter(ranked.c.rn == 1).all()
+    return {cid: pid for cid, pid in rows}
+
+# ------------------------------
+# Leases (sharded scheduler runs)
+# ------------------------------
+def claim_due_clients(db, now_utc: datetime, owner: str, limit: int,
+                      shard: int = 0, shards: int = 1, client_ids=None) -> list[int]:
+    """
+    Lease up to `limit` due clients of one shard to `owner` and return their
+    ids. Clients leased by another run are skipped until the lease expires
+    (SKIP LOCKED on Postgres; the conditional UPDATE alone on SQLite), so no
+    client is handled by two runs at once.
+    """
+    now = now_utc.replace(tzinfo=None)
+    free = or_(Client.lease_until.is_(None), Client.lease_until < now)
+    q = db.query(Client.id).filter(Client.next_post_at <= now, free)
+    if shards > 1:
+        q = q.filter(in_shard(Client.id, shard, shards))
+    if client_ids:
+        q = q.filter(Client.id.in_(list(client_ids)))
+    candidates = (q.order_by(Client.next_post_at.asc(), Client.id.asc())
+                   .limit(limit)
+                   .with_for_update(skip_locked=True)
+                   .scalar_subquery())
+    rows = db.execute(
+        update(Client)
+        .where(Client.id.in_(candidates), Client.next_post_at <= now, free)
+        .values(lease_owner=owner, lease_until=now + timedelta(seconds=SCHEDULER_LEASE_SECONDS))
+        .returning(Client.id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.commit()
+    return [r[0] for r in rows]
+
+def renew_leases(db, owner: str, client_ids) -> set[int]:
+    """
+    Extend `owner`'s lease on client_ids and return the ids it still holds.
+    Run it first in the writing transaction: the UPDATE row-locks the held
+    clients until commit, so no other run can take them over mid-write.
+    """
+    if not client_ids:
+        return set()
+    until = datetime.utcnow() + timedelta(seconds=SCHEDULER_LEASE_SECONDS)
+    rows = db.execute(
+        update(Client)
+        .where(Client.id.in_(list(client_ids)), Client.lease_owner == owner)
+        .values(lease_until=until)
+        .returning(Client.id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    return {r[0] for r in rows}
+
+def release_leases(db, owner: str):
+    db.execute(
+        update(Client)
+        .where(Client.lease_owner == owner)
+        .values(lease_owner=None, lease_until=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+# ------------------------------
+# Scheduler
+# ------------------------------
+PASS_STATS = ("due", "eligible", "scheduled", "quota_skipped", "fallback_caption")
+
+def observe_pass(stats: dict):
+    observe_scheduler_pass(
+        scanned=stats["due"], eligible=stats["eligible"], scheduled=stats["scheduled"],
+        quota_skipped=stats["quota_skipped"], fallback_caption=stats["fallback_caption"],
+    )
+
+def schedule_due_clients(db, due, now_utc: datetime, owner: str) -> dict:
+    """
+    One batched scheduler round over `due` [(client, local_date)], all
+    leased to `owner`. Issues a fixed number of statements (quota, today's
+    posts, drafts, then the writes) and commits once. Quota is taken with
+    one conditional upsert (see quota.reserve_slots), so overlapping runs
+    cannot push a client past its weekly limit. Every client's next_post_at
+    moves to tomorrow's post time, and its lease is released, in the same
+    commit.
+
+    Caption generation can outlast the lease, so the writes are fenced:
+    they start by renewing the lease (renew_leases) and skip every client
+    another run has taken over in the meantime.
+    """
+    stats = dict.fromkeys(PASS_STATS, 0)
+    stats["due"] = len(due)
+    if not due:
+        return stats
+    clients = {c.id: c for c, _ in due}
+    # post time on each client's local tomorrow
+    next_times = {c.id: fire_time_after_today(c, now_utc) for c, _ in due}
+    ids = list(clients)
+
+    ws = week_start_today()
+    remaining = remaining_slots(db, ids, ws)
+    posted_today = load_clients_with_post_on(db, due)
+
+    # cheap pre-filter so no caption is generated for a client that is
+    # over quota or already has a post today; the reservation below is
+    # the authoritative quota check
+    ready = [
+        cid for cid in ids
+        if remaining.get(cid, 0) > 0 and cid not in posted_today
+    ]
+    stats["eligible"] = len(ready)
+    if not ready:
+        advance_next_post_at(db, next_times, owner)
+        db.commit()
+        return stats
+
+    drafts = load_oldest_drafts(db, ready)
+
+    # generate via AI for clients without a draft (auto mode or fallback brief="")
+    jobs = []
+    for cid in ready:
+        if cid in drafts:
+            continue
+        c = clients[cid]
+        cats = (c.preferences_json or {}).get("categories", [])
+        jobs.append((cid, cats, c.city, c.model_name, c.industry))
+    caption_index.warm(db, [job[0] for job in jobs])
+    hashtag_bank.ensure_fresh(db)
+    # end the read transaction before the (slow) LLM calls
+    db.commit()
+    results = aio.run_sync(generate_captions(jobs)) if jobs else {}
+
+    # apply every change in one transaction, for clients still leased to us
+    held = renew_leases(db, owner, ids)
+    if len(held) < len(ids):
+        print(f"⚠️ Scheduler lease lost for {len(ids) - len(held)} clients; skipping them")
+        ready = [cid for cid in ready if cid in held]
+        drafts = {cid: pid for cid, pid in drafts.items() if cid in held}
+        results = {cid: res for cid, res in results.items() if cid in held}
+        next_times = {cid: at for cid, at in next_times.items() if cid in held}
+
+    # record usage first (to avoid double-posting on re-run)
+    reserved = reserve_slots(db, ready, ws)
+    now = datetime.utcnow()
+
+    # schedule it for “now” (publisher runs every X minutes)
+    scheduled_drafts = [pid for cid, pid in drafts.items() if cid in reserved]
+    if scheduled_drafts:
+        db.execute(
+            update(Post)
+            .where(Post.id.in_(scheduled_drafts))
+            .values(status="scheduled", scheduled_at=now)
+            .execution_options(synchronize_session=False)
+        )
+
+    # a generated caption whose client lost the quota race is kept as a draft
+    new_posts = [
+        {
+            "client_id": cid,
+            "caption": res.get("caption") or FALLBACK_CAPTION,
+            "hashtags": res.get("hashtags") or FALLBACK_HASHTAGS,
+            "status": "scheduled" if cid in reserved else "draft",
+            "created_at": now,
+            "scheduled_at": now if cid in reserved else None,
+        }
+        for cid, res in results.items()
+    ]
+    if new_posts:
+        db.execute(insert(Post), new_posts)
+
+    advance_next_post_at(db, next_times, owner)
+    db.commit()
+    for p in new_posts:
+        if p["status"] == "scheduled":
+            caption_index.add(p["client_id"], p["caption"])
+    stats["scheduled"] = len(reserved)
+    stats["quota_skipped"] = len(ready) - len(reserved)
+    stats["fallback_caption"] = sum(1 for res in results.values() if not res.get("caption"))
+    return stats
+
+def run_scheduler_shard(shard: int = 0, shards: int = 1, client_ids=None) -> dict:
+    """
+    Lease and schedule the due clients of one shard, SCHEDULER_BATCH_SIZE
+    at a time, until none are left (or SCHEDULER_MAX_ROUNDS). On failure
+    the remaining leases are dropped so the next sweep can retry at once.
+    """
+    owner = uuid.uuid4().hex
+    totals = dict.fromkeys(PASS_STATS, 0)
+    db = SessionLocal()
+    try:
+        for _ in range(SCHEDULER_MAX_ROUNDS):
+            now_utc = datetime.now(ZoneInfo("UTC"))
+            ids = claim_due_clients(db, now_utc, owner, SCHEDULER_BATCH_SIZE, shard, shards, client_ids)
+            if not ids:
+                break
+            stats = schedule_due_clients(db, load_due_clients(db, now_utc, ids), now_utc, owner)
+            for key in PASS_STATS:
+                totals[key] += stats[key]
+        return totals
+    except Exception:
+        db.rollback()
+        release_leases(db, owner)
+        raise
+    finally:
+        db.close()
 
 @shared_task
-def ai_daily_scheduler():
+def ai_daily_scheduler(client_ids=None, shards: int = None):
+    """
+    Scheduler pass over the clients whose next_post_at is due (optionally
+    only `client_ids`, for ETA-dispatched runs, which run inline).
+
+    A sweep splits the due clients into id shards (see schedule.shard_count)
+    and runs them as a Celery group, one scheduler_shard task per shard, so
+    the pass spreads over every worker; a chord then reports the totals
+    (scheduler_pass_report). Small passes run inline as a single shard.
+    Each shard leases its clients, so overlapping sweeps never handle the
+    same client twice.
+    """
+    if client_ids:
+        stats = run_scheduler_shard(client_ids=client_ids)
+        observe_pass(stats)
+        return stats
+
     db = SessionLocal()
     try:
-        clients = db.query(Client).all()
-        for c in clients:
-            # time check (local)
-            tz = ZoneInfo(c.timezone or "America/Los_Angeles")
-            now_local = datetime.now(tz)
-            target = now_local.replace(hour=c.post_time_hour or 17,
-                                       minute=c.post_time_minute or 0,
-                                       second=0, microsecond=0)
-            if now_local < target:
-                continue  # not time yet
-
-            # weekly usage
-            ws = week_start_today()
-            usage = (db.query(WeeklyUsage)
-                       .filter(WeeklyUsage.client_id==c.id,
-                               WeeklyUsage.week_start==ws)
-                       .first())
-            if not usage:
-                usage = WeeklyUsage(client_id=c.id, week_start=ws, posts_made=0)
-                db.add(usage); db.commit()
-
-            limit = get_weekly_limit(db, c.id)
-            if usage.posts_made >= limit:
-                continue  # quota reached
-
-            # if there is already a scheduled/post due today, skip
-            existing = (db.query(Post)
-                          .filter(Post.client_id==c.id,
-                                  Post.status.in_(["scheduled","posted"]))
-                          .filter(func.date(Post.scheduled_at) == now_local.date())
-                          .first())
-            if existing:
+        now_utc = datetime.now(ZoneInfo("UTC"))
+        due = (db.query(func.count(Client.id))
+                 .filter(Client.next_post_at <= now_utc.replace(tzinfo=None))
+                 .scalar())
+        dispatch_next_due(db, now_utc)
+    finally:
+        db.close()
+
+    shards = shards or shard_count(due)
+    if not due or shards == 1:
+        stats = run_scheduler_shard()
+        observe_pass(stats)
+        return stats
+
+    chord(group(scheduler_shard.s(k, shards) for k in range(shards)))(
+        scheduler_pass_report.s(started=time.time())
+    )
+    print(f"[OK] Scheduler pass: {due} due clients in {shards} shards")
+    return {"due": due, "shards": shards}
+
+@shared_task
+def scheduler_shard(shard: int, shards: int):
+    """One shard of a sweep. Errors are reported, not raised, so the chord still completes."""
+    try:
+        return {"shard": shard, **run_scheduler_shard(shard, shards)}
+    except Exception as e:
+        print(f"❌ Scheduler shard {shard}/{shards} failed: {e!r}")
+        return {"shard": shard, "error": repr(e)}
+
+@shared_task
+def scheduler_pass_report(results, started: float = None):
+    """Chord body: aggregate stats of every shard in a sweep."""
+    totals = {key: sum(r.get(key, 0) for r in results) for key in PASS_STATS}
+    failed = [r["shard"] for r in results if r.get("error")]
+    observe_pass(totals)
+    report = {**totals, "shards": len(results), "failed_shards": failed}
+    if started:
+        report["seconds"] = round(time.time() - started, 2)
+    print(f"[OK] Scheduler pass done: {report}")
+    return report
+
+# ------------------------------
+# Caption fan-out
+# ------------------------------
+async def generate_captions(jobs, concurrency: int = None, timeout: float = None) -> dict[int, dict]:
+    """
+    Generates captions for many clients on one event loop.
+
+    jobs: iterable of (client_id, categories, city, model[, industry]).
+    At most `concurrency` requests are in flight; each one gets its own
+    `timeout` deadline. A client whose call fails or times out gets an
+    empty result (callers fall back to the canned caption) without
+    holding up the rest. A caption that repeats one of the client's recent
+    posts (see caption_index) is regenerated once, uncached, then dropped.
+
+    Jobs run grouped by model (resident models first, see
+    gateway.affinity_order) so a host that keeps one or two models loaded
+    swaps at most once per model instead of on every other request.
+    """
+    sem = asyncio.Semaphore(concurrency or GEN_CONCURRENCY)
+    timeout = timeout or GEN_TIMEOUT
+
+    async def one(client_id, cats, city, model, industry=None):
+        async with sem:
+            try:
+                for use_cache in (True, False):
+                    res = await asyncio.wait_for(
+                        generate_caption_async("", categories=cats, city=city, model=model,
+                                               timeout=timeout, use_cache=use_cache, industry=industry),
+                        timeout,
+                    )
+                    if not isinstance(res, dict):
+                        return client_id, {}
+                    if not caption_index.is_duplicate(client_id, res.get("caption")):
+                        return client_id, res
+                return client_id, {}
+            except Exception as e:
+                print(f"⚠️ Caption generation failed for client {client_id}: {e!r}")
+                return client_id, {}
+
+    by_model = {}
+    for job in jobs:
+        by_model.setdefault(job[3] or DEFAULT_MODEL, []).append(job)
+    if len(by_model) < 2:
+        return dict(await asyncio.gather(*(one(*job) for job in jobs)))
+
+    results = {}
+    order = await gateway.affinity_order({m: len(js) for m, js in by_model.items()})
+    for model in order:
+        results.update(await asyncio.gather(*(one(*job) for job in by_model[model])))
+    return results
+
+# ------------------------------
+# Publisher
+# ------------------------------
+def claim_due_posts(db, now: datetime, limit: int) -> list[int]:
+    """
+    Atomically move up to `limit` due scheduled posts to "publishing" and
+    return their ids, so overlapping runs never pick the same row.
+    """
+    due = (db.query(Post.id)
+             .filter(Post.status == "scheduled", Post.scheduled_at <= now)
+             .order_by(Post.scheduled_at.asc(), Post.id.asc())
+             .limit(limit)
+             .with_for_update(skip_locked=True)
+             .scalar_subquery())
+    rows = db.execute(
+        update(Post)
+        .where(Post.id.in_(due), Post.status == "scheduled")
+        .values(status="publishing", claimed_at=now)
+        .returning(Post.id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.commit()
+    return [r[0] for r in rows]
+
+def fail_stale_claims(db, now: datetime) -> list[int]:
+    """
+    Mark posts stuck in "publishing" for over PUBLISH_CLAIM_TIMEOUT (their
+    run died, maybe after Graph published them) as failed and return their
+    ids. They are never resent automatically; check the page before
+    rescheduling one by hand.
+    """
+    stale = and_(Post.status == "publishing",
+                 or_(Post.claimed_at.is_(None),
+                     Post.claimed_at < now - timedelta(seconds=PUBLISH_CLAIM_TIMEOUT)))
+    rows = db.execute(
+        update(Post)
+        .where(stale)
+        .values(status="failed")
+        .returning(Post.id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.commit()
+    return [r[0] for r in rows]
+
+def load_publish_items(db, post_ids) -> tuple[list[dict], list[int]]:
+    """Returns (items ready for Graph, ids of posts whose client has no page connected)."""
+    rows = (db.query(Post.id, Post.caption, Post.hashtags, Post.image_url,
+                     Client.facebook_page_id, Client.facebook_page_token)
+              .join(Client, Client.id == Post.client_id)
+              .filter(Post.id.in_(post_ids))
+              .all())
+    items, unpublishable = [], []
+    for pid, caption, hashtags, url, page_id, token in rows:
+        if not page_id or not token:
+            unpublishable.append(pid)
+            continue
+        message = "\n\n".join(part for part in (caption, hashtags) if part)
+        item = {"id": pid, "page_id": page_id, "token": token, "message": message}
+        # stored images are uploaded from disk; other URLs are fetched by Graph
+        if digest_from_url(url):
+            item["image_path"] = publish_path(url)
+            if not item["image_path"]:
+                unpublishable.append(pid)
                 continue
+        elif url:
+            item["image_url"] = url
+        items.append(item)
+    return items, unpublishable
+
+@shared_task
+def post_scheduled_posts():
+    """
+    Publish every due scheduled post. Each round claims a batch of rows,
+    sends them to Graph as concurrent batch requests (rate-limited per
+    page), then marks them posted/failed with one UPDATE per outcome.
+    Posts whose request never reached Graph (connection errors) go back to
+    "scheduled" for the next run; anything Graph may have acted on (4xx,
+    read timeouts, unreadable responses) is marked failed, never resent.
+    Posts a dead run left in "publishing" are marked failed for review
+    (see fail_stale_claims).
+    """
+    db = SessionLocal()
+    stats = {"posted": 0, "failed": 0, "retry": 0, "stale": 0}
+    ids = []
+    try:
+        stale = fail_stale_claims(db, datetime.utcnow())
+        if stale:
+            print(f"⚠️ Marked {len(stale)} posts stuck in publishing as failed (check before resending): {stale}")
+        stats["stale"] = len(stale)
+
+        for _ in range(PUBLISH_MAX_ROUNDS):
+            ids = claim_due_posts(db, datetime.utcnow(), PUBLISH_BATCH_SIZE)
+            if not ids:
+                break
+
+            items, unpublishable = load_publish_items(db, ids)
+            results = aio.run_sync(graph.publish_many(items)) if items else {}
+            # sent: from here on a failure leaves the round in "publishing"
+            # (fail_stale_claims), never hands it back for a resend
+            ids = []
 
-            # pick a draft or generate new via AI
-            post = (db.query(Post)
-                      .filter(Post.client_id==c.id, Post.status=="draft")
-                      .order_by(Post.created_at.asc())
-                      .first())
-
-            if not post:
-                # generate via AI (auto mode or fallback brief="")
-                cats = (c.preferences_json or {}).get("categories", [])
-                res = httpx_run_generate(c.id, cats, c.city, c.model_name)
-                caption = res.get("caption") or "New set just dropped 💥💅"
-                hashtags = res.get("hashtags") or "#NailInspo"
-                post = Post(client_id=c.id, caption=caption, hashtags=hashtags, status="draft")
-                db.add(post); db.commit()
-
-            # schedule it for “now” (publisher runs every X minutes)
-            post.status = "scheduled"
-            post.scheduled_at = datetime.utcnow()
-            db.add(post); db.commit()
-            # record usage immediately (to avoid double-posting on re-run)
-            usage.posts_made += 1
-            db.add(usage); db.commit()
+            posted = [pid for pid, (ok, _) in results.items() if ok]
+            failed = unpublishable + [pid for pid, (ok, _) in results.items() if ok is False]
+            retry = [pid for pid, (ok, _) in results.items() if ok is None]
+            for pid, (ok, detail) in results.items():
+                if not ok:
+                    print(f"❌ Publish failed for post {pid}: {detail}")
+
+            now = datetime.utcnow()
+            for status, post_ids, values in (
+                ("posted", posted, {"status": "posted", "posted_at": now}),
+                ("failed", failed, {"status": "failed"}),
+                ("retry", retry, {"status": "scheduled"}),
+            ):
+                if post_ids:
+                    db.execute(
+                        update(Post)
+                        .where(Post.id.in_(post_ids))
+                        .values(**values)
+                        .execution_options(synchronize_session=False)
+                    )
+                stats[status] += len(post_ids)
+            db.commit()
+
+            if retry:
+                break  # Graph is unreachable; leave the rest for the next run
+        return stats
+    except Exception:
+        db.rollback()
+        if ids:
+            # nothing of this round reached Graph: hand the claim back
+            db.execute(
+                update(Post)
+                .where(Post.id.in_(ids), Post.status == "publishing")
+                .values(status="scheduled", claimed_at=None)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+        raise
     finally:
         db.close()
-
-def httpx_run_generate(client_id, cats, city, model):
-    # Small wrapper to call the same async generator in a sync Celery context
-    import asyncio
-    from backend.services.ai import generate_caption_async
-    return asyncio.run(generate_caption_async("",
-        categories=cats, city=city, model=model))
\ No newline at end of file